@@ -1,13 +1,32 @@
 import os
+import sys
 import time
 import json
-import pandas as pd
-from flask import Flask, render_template, request, jsonify, send_file, Response
+import csv
+import re
+import hmac
+import queue
+import random
+import bisect
+import hashlib
+import importlib.util
+import sqlite3
+import uuid
+import tempfile
+import threading
+import itertools
+from contextlib import nullcontext
+from functools import partial
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import Flask, render_template, request, jsonify, Response
 from flask_cors import CORS
 from dotenv import load_dotenv
-import requests
 from datetime import datetime
-from io import BytesIO
+from io import StringIO
+
+# pandas, openpyxl and requests take seconds to import in the bundled executable, so they
+# are imported where they are first used (uploads, exports, Retell calls) rather than here
 
 # Load environment variables
 load_dotenv()
@@ -18,18 +37,1935 @@ CORS(app)
 # Configuration
 RETELL_API_KEY = os.getenv('RETELL_API_KEY')
 RETELL_AGENT_ID = os.getenv('RETELL_AGENT_ID')
-RETELL_API_BASE = "https://api.retellai.com/v2"
+RETELL_API_ROOT = os.getenv('RETELL_API_ROOT', 'https://api.retellai.com').rstrip('/')
+
+# HTTP client settings for Retell API traffic (timeouts in seconds)
+RETELL_CONNECT_TIMEOUT = float(os.getenv('RETELL_CONNECT_TIMEOUT', '5'))
+RETELL_READ_TIMEOUT = float(os.getenv('RETELL_READ_TIMEOUT', '30'))
+RETELL_MAX_RETRIES = int(os.getenv('RETELL_MAX_RETRIES', '3'))
+RETELL_RETRY_BASE_DELAY = float(os.getenv('RETELL_RETRY_BASE_DELAY', '0.5'))
+RETELL_RETRY_MAX_DELAY = float(os.getenv('RETELL_RETRY_MAX_DELAY', '20'))
+RETELL_POOL_SIZE = int(os.getenv('RETELL_POOL_SIZE', '20'))
+
+# Client-side rate limits for the Retell account
+RETELL_CALLS_PER_MINUTE = float(os.getenv('RETELL_CALLS_PER_MINUTE', '20'))
+RETELL_CONCURRENCY_LIMIT = int(os.getenv('RETELL_CONCURRENCY_LIMIT', '20'))
+RETELL_POLLS_PER_SECOND = float(os.getenv('RETELL_POLLS_PER_SECOND', '10'))
+# How long one patient's call may wait out account throttling before it is logged as an error
+CREATE_CALL_MAX_THROTTLE_WAIT = float(os.getenv('CREATE_CALL_MAX_THROTTLE_WAIT', '900'))
+
+# Phone numbers and agent details are cached for this long, then refreshed in the background
+# while the cached copy is still served, for up to METADATA_CACHE_MAX_STALE seconds (seconds)
+METADATA_CACHE_TTL = float(os.getenv('METADATA_CACHE_TTL', '300'))
+METADATA_CACHE_MAX_STALE = float(os.getenv('METADATA_CACHE_MAX_STALE', '86400'))
+
+# Embedded campaign state database (people, slots, call attempts, results)
+CAMPAIGN_DB_PATH = os.getenv('CAMPAIGN_DB_PATH', 'campaign_state.db')
+
+# Uploads are parsed in background jobs, this many rows at a time
+UPLOAD_CHUNK_ROWS = int(os.getenv('UPLOAD_CHUNK_ROWS', '5000'))
+MAX_RETAINED_UPLOAD_JOBS = 50
+
+# Campaign events kept for dashboards that (re)connect late, and finished campaigns kept readable
+EVENT_REPLAY_BUFFER = int(os.getenv('EVENT_REPLAY_BUFFER', '5000'))
+MAX_RETAINED_CAMPAIGNS = 20
+
+# Webhook-driven call completion; polling backs off to these intervals (seconds)
+RETELL_WEBHOOK_VERIFY = os.getenv('RETELL_WEBHOOK_VERIFY', 'true').lower() in ['true', 'yes', '1']
+CALL_POLL_MAX_INTERVAL = float(os.getenv('CALL_POLL_MAX_INTERVAL', '15'))
+CALL_POLL_MAX_INTERVAL_WITH_WEBHOOKS = float(os.getenv('CALL_POLL_MAX_INTERVAL_WITH_WEBHOOKS', '60'))
+CALL_ANALYSIS_WAIT_SECONDS = float(os.getenv('CALL_ANALYSIS_WAIT_SECONDS', '30'))
+# Background waiters for /get-call-result, and finished lookups kept for clients polling them
+MAX_CALL_RESULT_WAITERS = 16
+MAX_RETAINED_CALL_RESULTS = 200
+
+# Requests that can hold a connection open (event streams, long polls, exports); production
+# serving gives them their own worker pool so they can't starve short requests like /status
+LONG_REQUEST_PATH = re.compile(r'^/(?:campaigns/[^/]+/(?:stream|events)|get-call-result/[^/]+|download-results)$')
+
+# Prometheus-style /metrics; off by default, and recording is a single flag check while off
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() in ['true', 'yes', '1']
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SLOT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+WAIT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+POLL_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+# Retell endpoints as named by RetellClient callers; metric labels only ever use these
+RETELL_ENDPOINTS = ('create-phone-call', 'get-call', 'list-phone-numbers', 'get-agent')
+
+# Opt-in profiling of campaign runs, saved to CAMPAIGN_PROFILE_DIR: set CAMPAIGN_PROFILER to
+# profile every campaign, or pass "profile" to /start-calling to profile just that one
+CAMPAIGN_PROFILERS = ('cprofile', 'pyinstrument')
+CAMPAIGN_PROFILER = os.getenv('CAMPAIGN_PROFILER', '').lower()
+CAMPAIGN_PROFILE_DIR = os.getenv('CAMPAIGN_PROFILE_DIR', 'campaign_profiles')
+
+# Concurrency limits for the campaign dialer
+MAX_CONCURRENT_CALLS = int(os.getenv('MAX_CONCURRENT_CALLS', '5'))
+# Order campaigns dial people in: 'soonest_first' (nearest current appointment first) or 'file'
+CALL_ORDERINGS = ('soonest_first', 'file')
+DEFAULT_CALL_ORDERING = os.getenv('DEFAULT_CALL_ORDERING', 'soonest_first')
+MAX_CALLS_PER_FROM_NUMBER = int(os.getenv('MAX_CALLS_PER_FROM_NUMBER', '5'))
+# Column that splits people (and, when present, slots) into labs that can run their own campaigns
+LAB_COLUMN = 'Lab_Name'
+
+NS_PER_DAY = 86_400_000_000_000
+
+# Result columns in export order
+RESULT_COLUMNS = [
+    'Patient Name', 'Patient DOB', 'Call Successful', 'In Voicemail', 'User Sentiment',
+    'Appointment Confirmed', 'Appointment Rescheduled', 'New Appointment Date', 'Call Summary',
+    'Detailed Call Summary', 'To-do List', 'Asked for DNC', 'Recording URL', 'Outcome',
+    'Appointment Slot Removed', 'Slot Conflict'
+]
+RESULT_BOOLEAN_COLUMNS = {'Call Successful', 'In Voicemail', 'Appointment Rescheduled', 'Asked for DNC',
+                          'Appointment Slot Removed'}
+# Every value the Outcome column can take
+RESULT_OUTCOMES = ('rescheduled', 'no_reschedule', 'rescheduled_conflict', 'timeout', 'error',
+                   'skipped_invalid_phone', 'skipped_no_earlier_appointments', 'interrupted')
+# Results read from the store per batch while exporting
+EXPORT_BATCH_ROWS = 1000
+# Finished results are pre-rendered as CSV in segments of this many rows per campaign
+RESULT_SEGMENT_ROWS = int(os.getenv('RESULT_SEGMENT_ROWS', '1000'))
+
+# Country calling code assumed for numbers written without one (1 = US/Canada)
+DEFAULT_COUNTRY_CODE = os.getenv('DEFAULT_COUNTRY_CODE', '1').lstrip('+')
+
+# Line-by-line patterns for normalize_phone_numbers
+PHONE_FLOAT_SUFFIX = re.compile(r'\.0+$', re.M)
+# Separators after the marker stay on the same line, so a bare trailing 'x' can't eat the next number
+PHONE_EXTENSION = re.compile(r'(?:ext\.?|x|#)[^\w\n]*\d+$', re.M)
+PHONE_KEEP_DIGITS = str.maketrans({chr(c): None for c in range(128) if not (chr(c).isdigit() or chr(c) in '\n\x01')})
+PHONE_NANP_CODE = re.compile(r'^1(?=\d{10}$)', re.M | re.A)
+PHONE_TRUNK_PREFIX = re.compile(r'^0(?=\d)', re.M | re.A)
+# Anything that isn't E.164 (US/Canada numbers are always ten digits after the +1)
+PHONE_INVALID = re.compile(r'^(?!\+1\d{10}$|\+[2-9]\d{6,14}$).+$', re.M | re.A)
+
+# An empty or whitespace-only line, which pandas skips when reading CSV
+CSV_BLANK_LINE = re.compile(rb'^[ \t]*\r?\n', re.M)
+
+# People columns passed to the agent as dynamic variables, in payload order
+DYNAMIC_VAR_COLUMNS = (
+    'Patient-First', 'Patient-Last', 'Date_of_Birth', 'Lab_Name', 'Lab_Phone', 'Test_Type',
+    'Extracted_Appointment_Date', 'Appointment_Day_Of_Week', 'Appointment_Month',
+    'Appointment_Day_Of_Month', 'Is_Tonight', 'Is_Tomorrow'
+)
+
+
+def parse_datetime_column(series):
+    """Parse a column of date strings in one vectorized pass, leaving NaT for unreadable values
+
+    Times with a UTC offset are converted to UTC, so a column whose offsets change (across
+    DST, or with some rows naive) still parses as one naive datetime column.
+    """
+    import pandas as pd
+
+    parsed = pd.to_datetime(series, errors='coerce', utc=True)
+
+    # Rows in a different format than the first one fall back to per-value format inference
+    retry = parsed.isna() & series.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(series[retry].astype(str), errors='coerce', format='mixed', utc=True)
+
+    return parsed.dt.tz_localize(None).astype('datetime64[ns]')
+
+
+def normalize_phone_numbers(values, country_code=DEFAULT_COUNTRY_CODE):
+    """Normalize a column of phone numbers to E.164, returning a list ('' where unusable)
+
+    Numbers without a country code get `country_code`. The column is joined into one
+    string, one number per line, so every step runs as a single C-level pass instead
+    of once per row.
+    """
+    if not len(values):
+        return []
+
+    prefix = '+' + country_code
+    blob = '\n' + '\n'.join(str(value).strip().replace('\n', ' ') for value in values).lower()
+    # Numeric columns with blanks in them come back as floats; extensions can't be dialed
+    blob = PHONE_EXTENSION.sub('', PHONE_FLOAT_SUFFIX.sub('', blob))
+
+    # Mark international numbers (leading +, or the 00 dialing prefix) with \x01, then keep only digits
+    blob = blob.replace('\n+', '\n\x01').translate(PHONE_KEEP_DIGITS).replace('\n00', '\n\x01')
+    if country_code == '1':
+        # 011 dials out of US/Canada; 1 + ten digits already carries the country code
+        blob = PHONE_NANP_CODE.sub('', blob.replace('\n011', '\n\x01'))
+    else:
+        # Drop the national trunk prefix before adding the country code
+        blob = PHONE_TRUNK_PREFIX.sub('', blob)
+
+    # Prefix every line with the country code, then undo that for the international ones
+    blob = blob.replace('\n', '\n' + prefix).replace(prefix + '\x01', '+')
+    phones = PHONE_INVALID.sub('', blob)[1:].split('\n')
+
+    # Every later phone would land on the wrong patient if a line were lost or split
+    if len(phones) != len(values):
+        raise ValueError(f'Phone normalization returned {len(phones)} numbers for {len(values)} rows')
+    return phones
+
+
+def lab_key(value):
+    """The lab a Lab_Name value scopes a row to ('' when blank)"""
+    if value is None or value != value:
+        return ''
+    return str(value).strip()
+
+
+class Record:
+    """Read-only dict-like view of one row of a RecordTable"""
+
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def get(self, key, default=None):
+        position = self.table.positions.get(key)
+        if position is None:
+            return default
+        return self.table.columns[position][self.row]
+
+    def __getitem__(self, key):
+        position = self.table.positions.get(key)
+        if position is None:
+            raise KeyError(key)
+        return self.table.columns[position][self.row]
+
+    def __contains__(self, key):
+        return key in self.table.positions
+
+    def __iter__(self):
+        return iter(self.table.names)
+
+    def __len__(self):
+        return len(self.table.names)
+
+    def keys(self):
+        return self.table.names
+
+    def items(self):
+        row = self.row
+        return [(name, column[row]) for name, column in zip(self.table.names, self.table.columns)]
+
+    def to_dict(self):
+        return dict(self.items())
+
+
+class RecordTable:
+    """Rows stored column by column as plain Python values
+
+    Holding one list per column instead of a dict per row keeps large uploads
+    small, and repeated strings (lab names, test types) share one object.
+    """
+
+    record_type = Record
+
+    def __init__(self, names=()):
+        self.names = tuple(sys.intern(str(name)) for name in names)
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.columns = [[] for _ in self.names]
+        self._length = 0
+        self._strings = {}
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a table from a list of dicts, using every key any of them has"""
+        table = cls(dict.fromkeys(key for record in records for key in record))
+        table.append_records(records)
+        return table
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, row):
+        if not 0 <= row < self._length:
+            raise IndexError(row)
+        return self.record_type(self, row)
+
+    def __iter__(self):
+        for row in range(self._length):
+            yield self.record_type(self, row)
+
+    def _share(self, values):
+        strings = self._strings
+        return [strings.setdefault(value, value) if type(value) is str else value for value in values]
+
+    def append_frame(self, df):
+        """Add a dataframe's rows, converting numpy scalars to Python values"""
+        if not self.names:
+            self.__init__(df.columns)
+
+        for name, column in zip(self.names, self.columns):
+            column.extend(self._share(df[name].tolist()) if name in df.columns else [None] * len(df))
+        self._length += len(df)
+
+    def append_records(self, records):
+        for name, column in zip(self.names, self.columns):
+            column.extend(self._share(record.get(name) for record in records))
+        self._length += len(records)
+
+    def take(self, rows):
+        """Copy the given rows, in the given order, into a new table"""
+        table = type(self)(self.names)
+        table.columns = [[column[row] for row in rows] for column in self.columns]
+        table._length = len(table.columns[0]) if table.columns else len(rows)
+        table._strings = self._strings
+        return table
+
+    def to_dict(self, row):
+        return {name: column[row] for name, column in zip(self.names, self.columns)}
+
+
+class PersonRecord(Record):
+    """A person on the call list, with the values the dialer needs already prepared"""
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.table.display_names[self.row]
+
+    @property
+    def phone(self):
+        return self.table.phones[self.row]
+
+    @property
+    def appointment_ts(self):
+        return self.table.appointment_ts[self.row]
+
+    def render_call_payload(self, from_number, offers_json):
+        """Fill this person's pre-rendered create-phone-call body; offers_json is the slot list as JSON"""
+        return self.table.payload_template % (
+            json.dumps(from_number), json.dumps(self.phone), self.table.var_fragments[self.row],
+            json.dumps(offers_json))
+
+
+class SlotTable(RecordTable):
+    """Appointment slots, with each slot's JSON for the offer list cached until it is reserved"""
+
+    def __init__(self, names=()):
+        super().__init__(names)
+        self.fragments = {}
+
+    def fragment(self, row):
+        fragment = self.fragments.get(row)
+        if fragment is None:
+            fragment = json.dumps({name: str(column[row]) for name, column in zip(self.names, self.columns)})
+            self.fragments[row] = fragment
+        return fragment
+
+
+class PeopleTable(RecordTable):
+    """The call list, with dynamic-variable strings, phone numbers, names and current
+    appointment times worked out once instead of on every call
+
+    Appointment times are parsed the first time the dialer asks for them, so restoring
+    a stored list at startup doesn't need pandas.
+    """
+
+    record_type = PersonRecord
+
+    def __init__(self, names=()):
+        super().__init__(names)
+        # The request body is the same for everyone with this schema apart from the from/to
+        # numbers, the person's variables (pre-rendered per row) and the offered slots
+        self.var_names = [name for name in DYNAMIC_VAR_COLUMNS if name in self.positions]
+        self.var_keys = [json.dumps(name) + ': ' for name in self.var_names]
+        self.payload_template = (
+            '{"from_number": %s, "to_number": %s, "override_agent_id": '
+            + json.dumps(RETELL_AGENT_ID).replace('%', '%%')
+            + ', "retell_llm_dynamic_variables": {%s"Next_Open_Appointments": %s}}'
+        )
+        self.var_fragments = []
+        self.phones = []
+        self.display_names = []
+        self._appointment_ts = []
+        self._parse_lock = threading.Lock()
+        self.labs = []
+
+    def append_frame(self, df):
+        start = self._length
+        super().append_frame(df)
+        self._derive(start)
+
+    def append_records(self, records):
+        start = self._length
+        super().append_records(records)
+        self._derive(start)
+
+    def take(self, rows):
+        table = super().take(rows)
+        table.var_fragments = [self.var_fragments[row] for row in rows]
+        table.phones = [self.phones[row] for row in rows]
+        table.display_names = [self.display_names[row] for row in rows]
+        table._appointment_ts = [self.appointment_ts[row] for row in rows]
+        table.labs = [self.labs[row] for row in rows]
+        return table
+
+    def _column(self, name, start):
+        position = self.positions.get(name)
+        if position is None:
+            return [None] * (self._length - start)
+        return self.columns[position][start:]
+
+    def _derive(self, start):
+        var_values = [self._column(name, start) for name in self.var_names]
+        self.var_fragments.extend(
+            ''.join(key + json.dumps(str(value)) + ', ' for key, value in zip(self.var_keys, values))
+            for values in zip(*var_values))
+        if not var_values:
+            self.var_fragments.extend([''] * (self._length - start))
+
+        phone_column = 'phone number' if 'phone number' in self.positions else 'Cell Phone'
+        self.phones.extend(normalize_phone_numbers(self._column(phone_column, start)))
+
+        firsts = self._column('Patient-First', start)
+        lasts = self._column('Patient-Last', start)
+        self.display_names.extend(
+            f"{'' if first is None else first} {'' if last is None else last}".strip()
+            for first, last in zip(firsts, lasts))
+
+        self.labs.extend(lab_key(value) for value in self._column(LAB_COLUMN, start))
+
+    @property
+    def appointment_ts(self):
+        """Current appointment times (nanoseconds since epoch, None when unreadable) by row"""
+        if len(self._appointment_ts) < self._length:
+            with self._parse_lock:
+                start = len(self._appointment_ts)
+                if start < self._length:
+                    import pandas as pd
+
+                    dates = pd.Series(self._column('Extracted_Appointment_Date', start), dtype=object)
+                    self._appointment_ts.extend(
+                        None if pd.isna(ts) else ts.value for ts in parse_datetime_column(dates))
+        return self._appointment_ts
+
+    def lab_names(self):
+        """Distinct non-blank labs in file order"""
+        return [lab for lab in dict.fromkeys(self.labs) if lab]
+
+
+class SlotIndex:
+    """Open appointment slots parsed once at upload and kept sorted by date
+
+    When the slots have a Lab_Name column, methods taking `lab` only see that lab's
+    slots; lab=None (or slots without the column) means every slot.
+    """
+
+    def __init__(self, slots=None, timestamps=None, claims=None):
+        # Slot ids are rows of the slot table and positions in the timestamps list,
+        # which are sorted by timestamp (nanoseconds since epoch) and never reordered
+        if not isinstance(slots, SlotTable):
+            slots = SlotTable.from_records(slots or [])
+        self._slots = slots
+        self._timestamps = timestamps or []
+        # slot id -> call_id that reserved it
+        self.claims = dict(claims or {})
+        # Ids of open slots in date order; taken ids are dropped lazily
+        self._taken = set(self.claims)
+        self._order = [i for i in range(len(self._slots)) if i not in self._taken]
+        # The same, per lab (sorted subsequences of _order), with each lab's open count
+        self._labs = None
+        self._lab_orders = {}
+        self._lab_open = {}
+        if LAB_COLUMN in self._slots.positions:
+            self._labs = [lab_key(value) for value in self._slots.columns[self._slots.positions[LAB_COLUMN]]]
+            for slot_id in self._order:
+                self._lab_orders.setdefault(self._labs[slot_id], []).append(slot_id)
+            self._lab_open = {lab: len(order) for lab, order in self._lab_orders.items()}
+        # Reservations that collided with a slot another call already took
+        self.conflicts = []
+        # Soft holds on slots offered to calls still in progress: slot id -> holder, holder -> slot ids
+        self.holds = {}
+        self._held_by = {}
+        # Bumped whenever a slot is reserved or a hold released, so matchings know to redo
+        self.version = 0
+        # Timestamps and scan orders (lab -> (order list, array)) as numpy arrays, built by match()
+        self._ts_array = None
+        self._order_arrays = {}
+
+        # Lookup buckets for reservation: raw date text, exact datetime, calendar day
+        self._by_raw = {}
+        self._by_ts = {}
+        self._by_day = {}
+        dates = self._slots.columns[self._slots.positions['date']] if 'date' in self._slots.positions else None
+        for slot_id, ts in enumerate(self._timestamps):
+            self._by_raw.setdefault(str(dates[slot_id]) if dates else '', []).append(slot_id)
+            self._by_ts.setdefault(ts, []).append(slot_id)
+            self._by_day.setdefault(ts // NS_PER_DAY, []).append(slot_id)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Build the index from an appointments dataframe, returning (index, unparsed row numbers)"""
+        return cls.from_chunks([df])
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        """Build the index from appointment dataframes read in order, returning (index, unparsed row numbers)"""
+        import pandas as pd
+
+        slots = SlotTable()
+        timestamps = []
+        unparsed_rows = []
+
+        for df in chunks:
+            if 'date' in df.columns:
+                parsed = parse_datetime_column(df['date'])
+                valid = parsed.notna().to_numpy()
+                timestamps.extend(parsed[valid].astype('int64').tolist())
+            else:
+                valid = pd.Series(False, index=df.index).to_numpy()
+
+            # Report rows with a missing or unreadable date by their spreadsheet row number
+            # (chunks are indexed by row as read_upload_chunks numbers them)
+            unparsed_rows.extend(int(row) + 2 for row in df.index[~valid])
+            slots.append_frame(df[valid])
+
+        # Stable sort keeps file order among slots at the same time
+        order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+        return cls(slots.take(order), [timestamps[i] for i in order]), unparsed_rows
+
+    def __len__(self):
+        return len(self._slots) - len(self._taken)
+
+    def __iter__(self):
+        for slot_id in self._order:
+            if slot_id not in self._taken:
+                yield self._slots[slot_id]
+
+    def _scoped(self, lab):
+        if lab is None or self._labs is None:
+            return self._order
+        return self._lab_orders.get(lab, [])
+
+    def _in_lab(self, slot_id, lab):
+        return lab is None or self._labs is None or self._labs[slot_id] == lab
+
+    def count(self, lab=None):
+        """Open slots, optionally only those of one lab"""
+        if lab is None or self._labs is None:
+            return len(self)
+        return self._lab_open.get(lab, 0)
+
+    def first(self, limit=5, include_held=False, lab=None, prefer=()):
+        """Get the earliest `limit` open slots
+
+        Slot ids in `prefer` (which must be open slots of the lab) are taken first, in order.
+        """
+        order = self._scoped(lab)
+        return self._collect(order, len(order), limit, include_held, prefer)
+
+    def earlier_than(self, timestamp, limit=5, include_held=False, lab=None, prefer=()):
+        """Get the earliest `limit` open slots strictly before `timestamp` (nanoseconds since epoch)
+
+        Slot ids in `prefer` (which must be slots of the lab before `timestamp`) are taken first, in order.
+        """
+        # The scan order is a sorted subsequence of slot ids, so bisect on the timestamps it points at
+        order = self._scoped(lab)
+        hi = bisect.bisect_left(order, timestamp, key=self._timestamps.__getitem__)
+        return self._collect(order, hi, limit, include_held, prefer)
+
+    def _collect(self, order, hi, limit, include_held=False, prefer=()):
+        found = []
+        found_ids = set()
+        for slot_id in itertools.chain(prefer, itertools.islice(order, hi)):
+            if slot_id in self._taken or (slot_id in self.holds and not include_held) or slot_id in found_ids:
+                continue
+            found.append(self._slots[slot_id])
+            found_ids.add(slot_id)
+            if len(found) == limit:
+                break
+        return found
+
+    def hold(self, slots, holder):
+        """Keep slots offered on a call from being offered on other calls until `holder` releases them"""
+        if not slots:
+            return
+        for slot in slots:
+            self.holds[slot.row] = holder
+        self._held_by.setdefault(holder, []).extend(slot.row for slot in slots)
+
+    def release(self, holder):
+        released = self._held_by.pop(holder, None)
+        if released is None:
+            return
+        for slot_id in released:
+            if self.holds.get(slot_id) == holder:
+                del self.holds[slot_id]
+        self.version += 1
+
+    def match(self, deadlines, open_ended=0, lab=None):
+        """Greedy matching of people to open slots (held slots count as open)
+
+        `deadlines` are current appointment times in ascending order (a numpy array);
+        `open_ended` people have no current appointment and can take any slot. Giving each
+        deadline in turn the earliest unused slot is an optimal matching when every
+        person's options are all slots before a cutoff. Returns (assigned, spare): the slot
+        id for each deadline, then each open-ended person (-1 where there is none), and
+        the slot ids nobody was given, in date order.
+        """
+        import numpy as np
+
+        if self._ts_array is None:
+            self._ts_array = np.array(self._timestamps, dtype='int64')
+        # Scan orders only change when _take compacts them, which replaces the list
+        order = self._scoped(lab)
+        cached = self._order_arrays.get(lab)
+        if cached is None or cached[0] is not order:
+            cached = self._order_arrays[lab] = (order, np.fromiter(order, dtype='int64', count=len(order)))
+        order = cached[1]
+        if self._taken:
+            order = order[~np.isin(order, np.fromiter(self._taken, dtype='int64', count=len(self._taken)))]
+        open_ts = self._ts_array[order]
+
+        # Person i takes slot used[i] (the slots before them went to earlier deadlines) when it
+        # is still before their deadline, so used[i + 1] = min(used[i] + 1, slots before deadline i)
+        steps = np.arange(len(deadlines))
+        before = np.searchsorted(open_ts, deadlines, side='left')
+        used_after = steps + 1 + np.minimum(np.minimum.accumulate(before - steps - 1), 0)
+        used_before = np.concatenate(([0], used_after[:-1]))[:len(steps)]
+        matched = used_after > used_before
+        assigned = np.full(len(deadlines) + open_ended, -1, dtype='int64')
+        assigned[:len(deadlines)][matched] = order[used_before[matched]]
+
+        used = int(used_after[-1]) if len(steps) else 0
+        extra = order[used:used + open_ended]
+        assigned[len(deadlines):len(deadlines) + len(extra)] = extra
+        return assigned, order[used + len(extra):]
+
+    def reserve(self, new_date, call_id=None, lab=None):
+        """Claim the slot matching `new_date` for `call_id`, among `lab`'s slots
+
+        Returns (status, claimed_by, slot_id) where status is 'reserved', 'already_reserved'
+        (this call holds it already), 'conflict' (another call took it) or 'not_found'.
+        """
+        import pandas as pd
+
+        try:
+            parsed_new = pd.to_datetime(new_date)
+            # Compare in UTC, as parse_datetime_column stores slot times
+            if parsed_new.tzinfo is not None:
+                parsed_new = parsed_new.tz_convert(None)
+        except Exception:
+            parsed_new = None
+
+        # Exact matches first: the patient agreed to this specific slot
+        exact = list(self._by_raw.get(str(new_date), []))
+        if parsed_new is not None:
+            exact += self._by_ts.get(parsed_new.value, [])
+        exact = [slot_id for slot_id in exact if self._in_lab(slot_id, lab)]
+
+        if exact:
+            for slot_id in exact:
+                if slot_id not in self._taken:
+                    self._take(slot_id, call_id)
+                    return 'reserved', None, slot_id
+            for slot_id in exact:
+                if call_id is not None and self.claims.get(slot_id) == call_id:
+                    return 'already_reserved', None, slot_id
+
+            # Every matching slot is held by another call - record the double booking
+            claimed_by = self.claims.get(exact[0])
+            self.conflicts.append({
+                'slot_date': str(self._slots[exact[0]].get('date', '')),
+                'call_id': call_id,
+                'claimed_by': claimed_by
+            })
+            return 'conflict', claimed_by, None
+
+        # Fuzzy match: the earliest open slot on the same calendar day
+        if parsed_new is not None:
+            same_day = [slot_id for slot_id in self._by_day.get(parsed_new.value // NS_PER_DAY, [])
+                        if self._in_lab(slot_id, lab)]
+            for slot_id in same_day:
+                if call_id is not None and self.claims.get(slot_id) == call_id:
+                    return 'already_reserved', None, slot_id
+            for slot_id in same_day:
+                if slot_id not in self._taken:
+                    self._take(slot_id, call_id)
+                    return 'reserved', None, slot_id
+
+        return 'not_found', None, None
+
+    def rows(self):
+        """Yield (slot_id, timestamp, slot dict) for every slot, taken or not"""
+        for slot_id, ts in enumerate(self._timestamps):
+            yield slot_id, ts, self._slots.to_dict(slot_id)
+
+    def _take(self, slot_id, call_id):
+        self._taken.add(slot_id)
+        self.version += 1
+        self.claims[slot_id] = call_id
+        self.holds.pop(slot_id, None)
+        # A reserved slot is never offered again
+        self._slots.fragments.pop(slot_id, None)
+        if self._labs is not None:
+            self._lab_open[self._labs[slot_id]] -= 1
+        # Drop taken ids from the scan orders once they make up a quarter of them
+        stale = len(self._order) - len(self)
+        if stale > 32 and stale * 4 > len(self._order):
+            self._order = [i for i in self._order if i not in self._taken]
+            self._lab_orders = {lab: [i for i in order if i not in self._taken]
+                                for lab, order in self._lab_orders.items()}
+
+
+class RateLimitedError(Exception):
+    """Retell rejected a request because an account limit was reached"""
+
+
+class RetellAPIError(Exception):
+    """Retell answered with an unexpected status code"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """Thread-safe token bucket that blocks callers until a token is available"""
+
+    def __init__(self, rate_per_second, capacity=None):
+        self.rate = rate_per_second
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_second)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        # Refills pause until this time after Retell says we went too fast
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._updated = max(self._updated, now)
+
+    def _wait_needed(self, now):
+        wait = max(0.0, self._paused_until - now)
+        if self._tokens < 1:
+            wait += (1 - self._tokens) / self.rate
+        return wait
+
+    def acquire(self):
+        """Take one token, sleeping until one is free; returns seconds waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._wait_needed(now)
+                if wait <= 0:
+                    self._tokens -= 1
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def penalize(self, seconds):
+        """Drain the bucket and pause refills after a 429"""
+        with self._lock:
+            self._tokens = min(self._tokens, 0.0)
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def wait_time(self):
+        """Seconds the next caller would wait for a token"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return round(self._wait_needed(now), 2)
+
+
+class ConcurrencyGate:
+    """Caps live calls at the account concurrency limit, tightening when Retell pushes back
+
+    Lines are shared between campaigns by weight: whenever one frees up it goes to the
+    waiting campaign holding the fewest lines for its weight, oldest request first on a tie.
+    """
+
+    def __init__(self, limit):
+        self.max_limit = limit
+        self.limit = limit
+        self.active = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+        # owner -> weight, lines held, and queued request tickets
+        self._weights = {}
+        self.held = {}
+        self._waiting = {}
+        self._tickets = 0
+
+    def set_weight(self, owner, weight):
+        with self._cond:
+            self._weights[owner] = weight
+            self._cond.notify_all()
+
+    def forget(self, owner):
+        with self._cond:
+            self._weights.pop(owner, None)
+
+    def _next_ticket(self):
+        owner = min(self._waiting, key=lambda o: (self.held.get(o, 0) / self._weights.get(o, 1.0),
+                                                  self._waiting[o][0]))
+        return self._waiting[owner][0]
+
+    def acquire(self, owner=None):
+        with self._cond:
+            self._tickets += 1
+            ticket = self._tickets
+            self._waiting.setdefault(owner, deque()).append(ticket)
+            while self.active >= self.limit or self._next_ticket() != ticket:
+                self._cond.wait()
+
+            waiting = self._waiting[owner]
+            waiting.popleft()
+            if not waiting:
+                del self._waiting[owner]
+            self.active += 1
+            self.held[owner] = self.held.get(owner, 0) + 1
+            # The next waiter in line may fit too
+            self._cond.notify_all()
+
+    def release(self, throttled=False, owner=None):
+        with self._cond:
+            self.active -= 1
+            self.held[owner] -= 1
+            if not self.held[owner]:
+                del self.held[owner]
+            if throttled:
+                # Retell is full with the calls still running; don't start more than that
+                self.limit = max(1, self.active)
+                self._successes = 0
+            self._cond.notify_all()
+
+    def queued(self):
+        """How many calls are waiting for a line"""
+        with self._cond:
+            return sum(len(waiting) for waiting in self._waiting.values())
+
+    def record_success(self):
+        """Creep back toward the configured limit after sustained successful call creation"""
+        with self._cond:
+            self._successes += 1
+            if self._successes >= 10 and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+
+class RetellClient:
+    """Pooled keep-alive HTTP client for the Retell API with retries and latency counters"""
+
+    def __init__(self, api_key, pool_size=RETELL_POOL_SIZE, max_retries=RETELL_MAX_RETRIES,
+                 timeout=(RETELL_CONNECT_TIMEOUT, RETELL_READ_TIMEOUT)):
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.timeout = timeout
+        # Opened on the first request
+        self._session = None
+        self._session_lock = threading.Lock()
+
+        # endpoint -> counters; endpoints are path templates, never call ids
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.headers['Authorization'] = f"Bearer {self.api_key}"
+                    self._session = session
+        return self._session
+
+    def get(self, path, endpoint, **kwargs):
+        return self.request('GET', path, endpoint, idempotent=True, **kwargs)
+
+    def post(self, path, endpoint, **kwargs):
+        return self.request('POST', path, endpoint, idempotent=False, **kwargs)
+
+    def request(self, method, path, endpoint, idempotent=True, rate_limiter=None, **kwargs):
+        """Send a request, retrying 429s (and 5xx / dropped connections when safe to repeat)"""
+        import requests
+
+        url = f"{RETELL_API_ROOT}{path}"
+
+        for attempt in range(self.max_retries + 1):
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(endpoint, time.perf_counter() - start, error=True, status='network')
+                # A POST that reached Retell may already have created a call, so
+                # only retry it when the connection was never established
+                retryable = idempotent or isinstance(e, requests.ConnectTimeout)
+                if not retryable or attempt == self.max_retries:
+                    raise
+                self._sleep_before_retry(endpoint, attempt)
+                continue
+
+            throttled = response.status_code == 429
+            server_error = response.status_code >= 500
+            self._record(endpoint, time.perf_counter() - start, error=throttled or server_error,
+                         status=self._status_class(response.status_code))
+
+            if throttled and rate_limiter is not None:
+                # Slow every caller sharing this limiter, not just this one
+                rate_limiter.penalize(self._retry_delay(attempt, response.headers.get('Retry-After')))
+
+            if attempt < self.max_retries and (throttled or (server_error and idempotent)):
+                self._sleep_before_retry(endpoint, attempt, response.headers.get('Retry-After'))
+                continue
+
+            return response
+
+    @staticmethod
+    def _retry_delay(attempt, retry_after=None):
+        # Full jitter so concurrent workers don't retry in lockstep
+        delay = random.uniform(0, min(RETELL_RETRY_MAX_DELAY, RETELL_RETRY_BASE_DELAY * 2 ** attempt))
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        return delay
+
+    def _sleep_before_retry(self, endpoint, attempt, retry_after=None):
+        delay = self._retry_delay(attempt, retry_after)
+
+        with self._stats_lock:
+            self._stats.setdefault(endpoint, self._empty_stats())['retries'] += 1
+        metrics.inc('retell_retries_total', endpoint=endpoint)
+        time.sleep(delay)
+
+    @staticmethod
+    def _empty_stats():
+        return {'requests': 0, 'errors': 0, 'retries': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+
+    @staticmethod
+    def _status_class(status_code):
+        return '429' if status_code == 429 else f'{status_code // 100}xx'
+
+    def _record(self, endpoint, elapsed, error=False, status='2xx'):
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, self._empty_stats())
+            stats['requests'] += 1
+            stats['errors'] += int(error)
+            stats['total_seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+        metrics.observe('retell_request_seconds', elapsed, endpoint=endpoint)
+        metrics.inc('retell_requests_total', endpoint=endpoint, status=status)
+
+    def latency_stats(self):
+        """Per-endpoint request counts and latency in milliseconds"""
+        with self._stats_lock:
+            return {
+                endpoint: {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'retries': stats['retries'],
+                    'avg_ms': round(stats['total_seconds'] * 1000 / stats['requests'], 1) if stats['requests'] else 0.0,
+                    'max_ms': round(stats['max_seconds'] * 1000, 1)
+                }
+                for endpoint, stats in self._stats.items()
+            }
+
+
+class MetadataCache:
+    """In-process TTL cache for slow-changing Retell data such as phone numbers and agent details
+
+    Entries younger than `ttl` are served as is. Older ones are still served, up to
+    `max_stale`, while a background thread refreshes them; only a missing or expired
+    entry makes the caller wait. Concurrent loads of one key share a single request.
+    """
+
+    def __init__(self, ttl=METADATA_CACHE_TTL, max_stale=METADATA_CACHE_MAX_STALE):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._loaders = {}
+        # key -> (value, monotonic time fetched)
+        self._entries = {}
+        # key -> Event set when the load in flight finishes
+        self._loading = {}
+        self._errors = {}
+        # Bumped by invalidate so loads started before it don't store old data
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def register(self, key, loader):
+        self._loaders[key] = loader
+
+    def get(self, key):
+        """Return (value, 'hit' | 'stale' | 'miss'), loading the value first if there is none usable"""
+        entry, age = self._entry(key)
+        if entry is not None and age < self.ttl:
+            return entry[0], 'hit'
+        if entry is not None and age < self.max_stale:
+            self.refresh(key)
+            return entry[0], 'stale'
+
+        self._load(key)
+        new_entry, _ = self._entry(key)
+        if new_entry is not None and new_entry is not entry:
+            return new_entry[0], 'miss'
+        # The load failed; an expired copy still beats an error page
+        if entry is not None:
+            return entry[0], 'stale'
+        raise self._errors.get(key) or KeyError(key)
+
+    def peek(self, key):
+        """The cached value (or None) without waiting; starts a refresh if it isn't fresh"""
+        entry, age = self._entry(key)
+        if entry is None or age >= self.ttl:
+            self.refresh(key)
+        return entry[0] if entry is not None else None
+
+    def refresh(self, key):
+        """Reload a key on a background thread unless a load is already in flight"""
+        if key not in self._loading:
+            threading.Thread(target=self._load, args=(key, False), name=f'cache-refresh-{key}', daemon=True).start()
+
+    def invalidate(self, key=None):
+        """Drop one key, or every key, so the next read fetches fresh data"""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry, (time.monotonic() - entry[1] if entry is not None else None)
+
+    def _load(self, key, wait=True):
+        with self._lock:
+            done = self._loading.get(key)
+            if done is not None:
+                owner = False
+            else:
+                owner = True
+                done = self._loading[key] = threading.Event()
+                generation = self._generation
+
+        if not owner:
+            if wait:
+                done.wait()
+            return
+
+        try:
+            value = self._loaders[key]()
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[key] = (value, time.monotonic())
+                self._errors.pop(key, None)
+        except Exception as e:
+            self._errors[key] = e
+        finally:
+            with self._lock:
+                del self._loading[key]
+            done.set()
+
+
+class Metrics:
+    """Counters, histograms and gauges rendered in the Prometheus text format for /metrics
+
+    Every label is declared with the values it may take and anything else is reported as
+    'other', so patient names, phone numbers and call ids can never reach a label. Gauges
+    are read when /metrics is scraped; counters and histograms cost one flag check while
+    metrics are disabled.
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        # name -> definition and values; values map a tuple of label values to a count
+        self._metrics = OrderedDict()
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text, labels=None):
+        self._metrics[name] = {'type': 'counter', 'help': help_text, 'labels': labels or {}, 'values': {}}
+
+    def histogram(self, name, help_text, buckets, labels=None):
+        self._metrics[name] = {'type': 'histogram', 'help': help_text, 'labels': labels or {}, 'values': {},
+                               'buckets': tuple(buckets)}
+
+    def gauge(self, name, help_text, read):
+        self._metrics[name] = {'type': 'gauge', 'help': help_text, 'read': read}
+
+    @staticmethod
+    def _key(metric, labels):
+        return tuple(labels.get(name) if labels.get(name) in allowed else 'other'
+                     for name, allowed in metric['labels'].items())
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        metric = self._metrics[name]
+        key = self._key(metric, labels)
+        with self._lock:
+            metric['values'][key] = metric['values'].get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        metric = self._metrics[name]
+        key = self._key(metric, labels)
+        bucket = bisect.bisect_left(metric['buckets'], value)
+        with self._lock:
+            counts = metric['values'].get(key)
+            if counts is None:
+                # One count per bucket plus +Inf, then the sum
+                counts = metric['values'][key] = [0] * (len(metric['buckets']) + 1) + [0.0]
+            counts[bucket] += 1
+            counts[-1] += value
+
+    def timer(self, name, **labels):
+        """Context manager observing how long its block takes into histogram `name`"""
+        if not self.enabled:
+            return NULL_TIMER
+        return MetricTimer(self, name, labels)
+
+    @staticmethod
+    def _format_labels(pairs):
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+    @staticmethod
+    def _format_number(value):
+        if isinstance(value, int):
+            return str(value)
+        return repr(float(value))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+
+            if metric['type'] == 'gauge':
+                lines.append(f"{name} {self._format_number(metric['read']())}")
+                continue
+
+            with self._lock:
+                values = sorted((key, list(counts) if isinstance(counts, list) else counts)
+                                for key, counts in metric['values'].items())
+
+            for key, value in values:
+                pairs = list(zip(metric['labels'], key))
+                if metric['type'] == 'counter':
+                    lines.append(f"{name}{self._format_labels(pairs)} {self._format_number(value)}")
+                    continue
+
+                cumulative = 0
+                for bound, count in zip(metric['buckets'] + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else self._format_number(bound)
+                    lines.append(f"{name}_bucket{self._format_labels(pairs + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{self._format_labels(pairs)} {self._format_number(value[-1])}")
+                lines.append(f"{name}_count{self._format_labels(pairs)} {cumulative}")
+
+        return '\n'.join(lines) + '\n'
+
+
+class MetricTimer:
+    """Times a block into a Metrics histogram"""
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+# Stands in for MetricTimer while metrics are disabled
+NULL_TIMER = nullcontext()
+
+
+class CampaignStore:
+    """SQLite (WAL) store for uploaded data, call attempts and results so a restart loses nothing"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS people (
+            row_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS slots (
+            slot_id INTEGER PRIMARY KEY,
+            slot_ts INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            claimed_by TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_slots_claimed ON slots(claimed_by) WHERE claimed_by IS NOT NULL;
+        CREATE TABLE IF NOT EXISTS campaigns (
+            campaign_id TEXT PRIMARY KEY,
+            from_number TEXT NOT NULL,
+            max_concurrent_calls INTEGER NOT NULL,
+            people_version INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            next_row INTEGER NOT NULL DEFAULT 0,
+            ordering TEXT NOT NULL DEFAULT 'file',
+            lab_name TEXT,
+            weight REAL NOT NULL DEFAULT 1,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS call_attempts (
+            attempt_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            campaign_id TEXT NOT NULL,
+            person_row INTEGER,
+            call_id TEXT,
+            status TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            ended_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_attempts_campaign ON call_attempts(campaign_id, status);
+        CREATE INDEX IF NOT EXISTS idx_attempts_call ON call_attempts(call_id);
+        CREATE TABLE IF NOT EXISTS results (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            campaign_id TEXT NOT NULL,
+            person_row INTEGER,
+            call_id TEXT,
+            outcome TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_results_campaign ON results(campaign_id, seq);
+        CREATE INDEX IF NOT EXISTS idx_results_outcome ON results(campaign_id, outcome);
+        CREATE INDEX IF NOT EXISTS idx_results_call ON results(call_id) WHERE call_id IS NOT NULL;
+        CREATE TABLE IF NOT EXISTS result_segments (
+            campaign_id TEXT NOT NULL,
+            first_seq INTEGER NOT NULL,
+            last_seq INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            csv TEXT NOT NULL,
+            PRIMARY KEY (campaign_id, first_seq)
+        );
+    """
+
+    # Columns added since the first release, as (table, column, definition)
+    MIGRATIONS = [
+        ('campaigns', 'ordering', "TEXT NOT NULL DEFAULT 'file'"),
+        ('campaigns', 'lab_name', 'TEXT'),
+        ('campaigns', 'weight', 'REAL NOT NULL DEFAULT 1')
+    ]
+
+    def __init__(self, path):
+        self.path = path
+        # One connection per thread; WAL lets readers run while a worker writes
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        # campaign_id -> last seq written into a result segment
+        self._sealed = {}
+        self._segment_lock = threading.Lock()
+        with self._write_lock:
+            conn = self._conn()
+            conn.executescript(self.SCHEMA)
+            for table, column, definition in self.MIGRATIONS:
+                if column not in {info[1] for info in conn.execute(f'PRAGMA table_info({table})')}:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _write(self, sql, params=()):
+        with self._write_lock:
+            return self._conn().execute(sql, params)
+
+    def _write_many(self, statements):
+        """Run several (sql, params or rows, many) statements in one transaction; returns their cursors"""
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursors = [conn.executemany(sql, params) if many else conn.execute(sql, params)
+                           for sql, params, many in statements]
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            return cursors
+
+    def _scalar(self, sql, params=()):
+        row = self._conn().execute(sql, params).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _dumps(data):
+        return json.dumps(data, default=str)
+
+    # Metadata (schemas, counters, current campaign)
+
+    def get_meta(self, key, default=None):
+        value = self._scalar('SELECT value FROM meta WHERE key = ?', (key,))
+        return json.loads(value) if value is not None else default
+
+    def set_meta(self, key, value):
+        self._write('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, self._dumps(value)))
+
+    # People and slots
+
+    def replace_people(self, records):
+        self._write_many([
+            ('DELETE FROM people', (), False),
+            ('INSERT INTO people (row_id, data) VALUES (?, ?)',
+             ((row_id, self._dumps(record)) for row_id, record in enumerate(records)), True)
+        ])
+
+    def begin_people_upload(self):
+        """Start a staging table that a chunked upload fills before it replaces people"""
+        with self._write_lock:
+            self._conn().executescript("""
+                DROP TABLE IF EXISTS people_staging;
+                CREATE TABLE people_staging (row_id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+            """)
+
+    def stage_people(self, start_row, records):
+        self._write_many([
+            ('INSERT INTO people_staging (row_id, data) VALUES (?, ?)',
+             ((start_row + i, self._dumps(record)) for i, record in enumerate(records)), True)
+        ])
+
+    def finish_people_upload(self):
+        """Swap the staged rows in as the people list in one transaction"""
+        self._write_many([
+            ('DROP TABLE people', (), False),
+            ('ALTER TABLE people_staging RENAME TO people', (), False)
+        ])
+
+    def load_people(self):
+        return PeopleTable.from_records(
+            [json.loads(data) for (data,) in self._conn().execute('SELECT data FROM people ORDER BY row_id')])
+
+    def replace_slots(self, slot_index):
+        self._write_many([
+            ('DELETE FROM slots', (), False),
+            ('INSERT INTO slots (slot_id, slot_ts, data, claimed_by) VALUES (?, ?, ?, ?)',
+             ((slot_id, ts, self._dumps(slot), slot_index.claims.get(slot_id))
+              for slot_id, ts, slot in slot_index.rows()), True)
+        ])
+
+    def load_slot_index(self):
+        slots, timestamps, claims = [], [], {}
+        for slot_id, ts, data, claimed_by in self._conn().execute(
+                'SELECT slot_id, slot_ts, data, claimed_by FROM slots ORDER BY slot_id'):
+            slots.append(json.loads(data))
+            timestamps.append(ts)
+            if claimed_by is not None:
+                claims[slot_id] = claimed_by
+        return SlotIndex(slots, timestamps, claims)
+
+    def claim_slot(self, slot_id, call_id):
+        self._write('UPDATE slots SET claimed_by = ? WHERE slot_id = ?', (call_id or '', slot_id))
+
+    def count_slots(self):
+        return self._scalar('SELECT COUNT(*) FROM slots')
+
+    def count_claimed_slots(self):
+        return self._scalar('SELECT COUNT(*) FROM slots WHERE claimed_by IS NOT NULL')
+
+    # Campaigns and checkpoints
+
+    def create_campaign(self, campaign_id, from_number, max_concurrent_calls, people_version, ordering,
+                        lab_name=None, weight=1.0):
+        now = time.time()
+        self._write(
+            'INSERT INTO campaigns (campaign_id, from_number, max_concurrent_calls, people_version, status, '
+            'next_row, ordering, lab_name, weight, created_at, updated_at) VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?, ?, ?)',
+            (campaign_id, from_number, max_concurrent_calls, people_version, 'running', ordering, lab_name, weight,
+             now, now)
+        )
+
+    def checkpoint(self, campaign_id, next_row):
+        """Record that every person before position next_row of the dialing order has been dialed or skipped"""
+        self._write('UPDATE campaigns SET next_row = ?, updated_at = ? WHERE campaign_id = ?',
+                    (next_row, time.time(), campaign_id))
+
+    def set_campaign_status(self, campaign_id, status):
+        self._write('UPDATE campaigns SET status = ?, updated_at = ? WHERE campaign_id = ?',
+                    (status, time.time(), campaign_id))
+
+    def mark_interrupted_campaigns(self):
+        """Campaigns still 'running' at startup were cut off by a crash or restart"""
+        self._write("UPDATE campaigns SET status = 'interrupted' WHERE status = 'running'")
+
+    def get_campaign(self, campaign_id):
+        row = self._conn().execute(
+            'SELECT campaign_id, from_number, max_concurrent_calls, people_version, status, next_row, '
+            'ordering, lab_name, weight, created_at, updated_at FROM campaigns WHERE campaign_id = ?', (campaign_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ['campaign_id', 'from_number', 'max_concurrent_calls', 'people_version', 'status',
+                'next_row', 'ordering', 'lab_name', 'weight', 'created_at', 'updated_at']
+        campaign = dict(zip(keys, row))
+        campaign['results_count'] = self.count_results(campaign_id)
+        campaign['in_flight_calls'] = len(self.open_attempts(campaign_id))
+        return campaign
+
+    def list_campaigns(self):
+        ids = [campaign_id for (campaign_id,) in self._conn().execute(
+            'SELECT campaign_id FROM campaigns ORDER BY created_at DESC')]
+        return [self.get_campaign(campaign_id) for campaign_id in ids]
+
+    def open_attempts(self, campaign_id):
+        """Attempts that never recorded a result: (attempt_id, person_row, call_id, status)"""
+        return self._conn().execute(
+            "SELECT attempt_id, person_row, call_id, status FROM call_attempts "
+            "WHERE campaign_id = ? AND status IN ('queued', 'dialing', 'in_progress') ORDER BY attempt_id",
+            (campaign_id,)
+        ).fetchall()
+
+    def finished_rows(self, campaign_id):
+        return {row for (row,) in self._conn().execute(
+            'SELECT person_row FROM results WHERE campaign_id = ? AND person_row IS NOT NULL', (campaign_id,))}
+
+    # Call attempts and results
+
+    def start_attempt(self, campaign_id, person_row):
+        """Queue a person for dialing; returns the attempt id"""
+        cursor = self._write(
+            'INSERT INTO call_attempts (campaign_id, person_row, status, started_at) VALUES (?, ?, ?, ?)',
+            (campaign_id, person_row, 'queued', time.time())
+        )
+        return cursor.lastrowid
+
+    def close_attempt(self, attempt_id, status):
+        self._write('UPDATE call_attempts SET status = ?, ended_at = ? WHERE attempt_id = ?',
+                    (status, time.time(), attempt_id))
+
+    def mark_attempt_dialing(self, attempt_id):
+        self._write("UPDATE call_attempts SET status = 'dialing' WHERE attempt_id = ?", (attempt_id,))
+
+    def set_attempt_call(self, attempt_id, call_id):
+        self._write('UPDATE call_attempts SET call_id = ?, status = ? WHERE attempt_id = ?',
+                    (call_id, 'in_progress', attempt_id))
+
+    def add_result(self, campaign_id, person_row, call_id, result, attempt_id=None):
+        """Record a final result (and close its attempt) in one transaction
+
+        Returns its seq, or None when the call already has a result (a call is only recorded once).
+        """
+        now = time.time()
+        statements = [(
+            'INSERT INTO results (campaign_id, person_row, call_id, outcome, data, created_at) '
+            'SELECT ?, ?, ?, ?, ?, ? WHERE ? IS NULL OR NOT EXISTS (SELECT 1 FROM results WHERE call_id = ?)',
+            (campaign_id, person_row, call_id, result.get('Outcome', ''), self._dumps(result), now, call_id, call_id),
+            False
+        )]
+        if attempt_id is not None:
+            statements.append((
+                'UPDATE call_attempts SET status = ?, ended_at = ? WHERE attempt_id = ?',
+                ('done', now, attempt_id), False
+            ))
+        inserted = self._write_many(statements)[0]
+        return inserted.lastrowid if inserted.rowcount == 1 else None
+
+    def result_for_call(self, call_id):
+        data = self._scalar('SELECT data FROM results WHERE call_id = ? ORDER BY seq LIMIT 1', (call_id,))
+        return json.loads(data) if data is not None else None
+
+    def attempt_for_call(self, call_id):
+        """(attempt_id, campaign_id, person_row) of the campaign attempt that placed a call, if any"""
+        return self._conn().execute(
+            'SELECT attempt_id, campaign_id, person_row FROM call_attempts WHERE call_id = ? '
+            'ORDER BY attempt_id DESC LIMIT 1', (call_id,)
+        ).fetchone()
+
+    def count_results(self, campaign_id):
+        return self._scalar('SELECT COUNT(*) FROM results WHERE campaign_id = ?', (campaign_id,))
+
+    def max_result_seq(self, campaign_id):
+        return self._scalar('SELECT MAX(seq) FROM results WHERE campaign_id = ?', (campaign_id,)) or 0
+
+    def iter_results(self, campaign_id, outcomes=None, since=0, until=None, batch_size=EXPORT_BATCH_ROWS):
+        """Yield results with since < seq <= until in order, a page at a time, optionally only
+        those with the given outcomes"""
+        where = 'campaign_id = ? AND seq > ? AND seq <= ?'
+        if outcomes:
+            where += f" AND outcome IN ({', '.join('?' * len(outcomes))})"
+        until = until if until is not None else self.max_result_seq(campaign_id)
+
+        last_seq = since
+        while True:
+            page = self._conn().execute(
+                f'SELECT seq, data FROM results WHERE {where} ORDER BY seq LIMIT ?',
+                (campaign_id, last_seq, until, *(outcomes or ()), batch_size)
+            ).fetchall()
+            for last_seq, data in page:
+                yield json.loads(data)
+            if len(page) < batch_size:
+                return
+
+    # Result segments
+
+    def seal_result_segments(self, campaign_id, size, render):
+        """Render each full run of `size` unsegmented results into a segment with render(results)"""
+        with self._segment_lock:
+            last_seq = self._sealed.get(campaign_id)
+            if last_seq is None:
+                last_seq = self._scalar('SELECT MAX(last_seq) FROM result_segments WHERE campaign_id = ?',
+                                        (campaign_id,)) or 0
+
+            while self._scalar('SELECT COUNT(*) FROM results WHERE campaign_id = ? AND seq > ?',
+                               (campaign_id, last_seq)) >= size:
+                page = self._conn().execute(
+                    'SELECT seq, data FROM results WHERE campaign_id = ? AND seq > ? ORDER BY seq LIMIT ?',
+                    (campaign_id, last_seq, size)
+                ).fetchall()
+                self._write(
+                    'INSERT INTO result_segments (campaign_id, first_seq, last_seq, row_count, csv) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (campaign_id, page[0][0], page[-1][0], len(page), render([json.loads(data) for _, data in page]))
+                )
+                last_seq = page[-1][0]
+
+            self._sealed[campaign_id] = last_seq
+
+    def result_segments(self, campaign_id, since=0, until=None):
+        """(first_seq, last_seq) of the segments holding only results with since < seq <= until"""
+        until = until if until is not None else self.max_result_seq(campaign_id)
+        return self._conn().execute(
+            'SELECT first_seq, last_seq FROM result_segments WHERE campaign_id = ? AND first_seq > ? '
+            'AND last_seq <= ? ORDER BY first_seq', (campaign_id, since, until)
+        ).fetchall()
+
+    def segment_csv(self, campaign_id, first_seq):
+        return self._scalar('SELECT csv FROM result_segments WHERE campaign_id = ? AND first_seq = ?',
+                            (campaign_id, first_seq))
+
+    def checkpoint_wal(self):
+        """Fold the write-ahead log into the database file, e.g. before the process exits"""
+        with self._write_lock:
+            self._conn().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+class UploadJob:
+    """A file being ingested in the background so the upload request returns right away"""
+
+    def __init__(self, kind, filename, path):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.filename = filename
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.status = 'queued'
+        self.rows = 0
+        self.progress = 0.0
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'filename': self.filename,
+            'status': self.status,
+            'rows': self.rows,
+            'progress': round(self.progress, 3),
+            'error': self.error,
+            'result': self.result
+        }
 
-# Global state
-people_data = []
-appointments_data = []
-call_results = []
-people_schema = {}
-appointments_schema = {}
-is_calling = False
-current_status = "Ready"
-original_appointments_count = 0
-rescheduled_count = 0
+
+class StatusTracker:
+    """Monotonic state version for /status that remembers which version last changed each field"""
+
+    def __init__(self, fields):
+        # Start from the clock so versions keep increasing across restarts
+        self.version = int(time.time() * 1000)
+        self._changed = {field: self.version for field in fields}
+        self._lock = threading.Lock()
+
+    def bump(self, *fields):
+        with self._lock:
+            self.version += 1
+            for field in fields:
+                self._changed[field] = self.version
+
+    def changed_since(self, since):
+        with self._lock:
+            return [field for field, version in self._changed.items() if version > since]
+
+
+class EventBus:
+    """In-process event log with a bounded replay buffer, read by sequence number"""
+
+    def __init__(self, maxlen=EVENT_REPLAY_BUFFER):
+        self._events = deque(maxlen=maxlen)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self.closed = False
+
+    def publish(self, event):
+        with self._cond:
+            self._seq += 1
+            self._events.append(dict(event, seq=self._seq))
+            self._cond.notify_all()
+            return self._seq
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def read(self, since=0, timeout=None):
+        """Return (events after `since`, truncated, closed), waiting up to `timeout` for new ones
+
+        truncated is True when some events after `since` already fell out of the buffer.
+        """
+        with self._cond:
+            if timeout and self._seq <= since and not self.closed:
+                self._cond.wait_for(lambda: self._seq > since or self.closed, timeout=timeout)
+
+            events = [event for event in self._events if event['seq'] > since]
+            oldest = self._events[0]['seq'] if self._events else self._seq + 1
+            return events, oldest > since + 1, self.closed and self._seq <= (events[-1]['seq'] if events else since)
+
+
+class CampaignProfiler:
+    """Profiles one campaign run and saves the profile to CAMPAIGN_PROFILE_DIR
+
+    cProfile covers the dispatcher and every call worker, merged into one .prof file for
+    pstats or snakeviz. pyinstrument (an optional package) samples the dispatcher thread,
+    where per-person work like slot filtering happens, and saves an HTML report. Profiles
+    hold function names and timings only, never call arguments, so they contain no PHI.
+    """
+
+    def __init__(self, campaign_id, kind='cprofile', directory=CAMPAIGN_PROFILE_DIR):
+        self.campaign_id = campaign_id
+        self.kind = kind
+        self.directory = directory
+        self.path = None
+        self._profiles = []
+        self._html = None
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args, **kwargs):
+        """Call fn, under cProfile when this campaign uses it"""
+        if self.kind != 'cprofile':
+            return fn(*args, **kwargs)
+
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile, and the one already running sees this thread too
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self._lock:
+                self._profiles.append(profile)
+
+    def run_dispatcher(self, fn, *args):
+        """Call the campaign's dispatch loop under the profiler"""
+        if self.kind != 'pyinstrument':
+            return self.run(fn, *args)
+
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            return fn(*args)
+        finally:
+            profiler.stop()
+            self._html = profiler.output_html()
+
+    def save(self):
+        """Write the profile to disk, returning its path (None when nothing was captured)"""
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"campaign_{self.campaign_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+        if self.kind == 'pyinstrument':
+            if self._html is None:
+                return None
+            path = base + '.html'
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self._html)
+        else:
+            import pstats
+
+            with self._lock:
+                profiles = list(self._profiles)
+            if not profiles:
+                return None
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            path = base + '.prof'
+            stats.dump_stats(path)
+
+        self.path = path
+        return path
+
+
+class CampaignRunner:
+    """Runs one campaign on a background thread, independent of any HTTP request
+
+    A campaign with a lab_name only dials that lab's people and offers that lab's slots;
+    its weight sets its share of the account's lines while other campaigns run.
+    """
+
+    def __init__(self, campaign_id, from_number, max_in_flight, ordering=DEFAULT_CALL_ORDERING, lab_name=None,
+                 weight=1.0, profiler=None):
+        self.campaign_id = campaign_id
+        self.from_number = from_number
+        self.max_in_flight = max_in_flight
+        self.ordering = ordering
+        self.lab_name = lab_name
+        self.weight = weight
+        # Dialing order (people rows) and how far along it the dispatcher is
+        self.plan = []
+        self.position = 0
+        # SlotMatcher over the people not yet dialed, once dispatching starts
+        self.matcher = None
+        self._status = "Starting"
+        self.bus = EventBus()
+        self.stop_requested = threading.Event()
+        # Set when the server is shutting down rather than the user stopping the campaign
+        self.interrupted = False
+        self.finished = threading.Event()
+        self.thread = None
+        # Name of a profiler in CAMPAIGN_PROFILERS to run this campaign under, if any
+        self.profiler = CampaignProfiler(campaign_id, profiler) if profiler else None
+
+    def start(self, start_row=0, skip_rows=(), reattach=()):
+        """Dispatch people from start_row on, skipping skip_rows, after reattaching to live calls"""
+        self.thread = threading.Thread(
+            target=self._run, args=(start_row, set(skip_rows), list(reattach)),
+            name=f'campaign-{self.campaign_id}', daemon=True
+        )
+        self.thread.start()
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, message):
+        if message != self._status:
+            self._status = message
+            status_tracker.bump('current_status', 'active_campaigns')
+
+    def is_running(self):
+        return self.thread is not None and not self.finished.is_set()
+
+    def overlaps(self, lab_name):
+        """Whether a campaign for lab_name (None = every lab) would dial the same people"""
+        return self.lab_name is None or lab_name is None or self.lab_name == lab_name
+
+    def to_dict(self):
+        return {
+            'campaign_id': self.campaign_id,
+            'lab_name': self.lab_name,
+            'from_number': self.from_number,
+            'weight': self.weight,
+            'max_concurrent_calls': self.max_in_flight,
+            'status': self.status,
+            'profile_path': self.profiler.path if self.profiler else None
+        }
+
+    def stop(self, message='Campaign stopped by user'):
+        """Stop dialing new people; calls already in progress finish and are recorded"""
+        if not self.stop_requested.is_set():
+            self.stop_requested.set()
+            self.status = "Stopping"
+            self.publish({'type': 'stopped', 'message': message})
+
+    def interrupt(self):
+        """Stop dialing because the server is shutting down; the campaign is left resumable"""
+        self.interrupted = True
+        self.stop('Server shutting down - resume the campaign after restarting')
+
+    def publish(self, event):
+        return self.bus.publish(event)
+
+    def estimated_matchable(self):
+        """How many people not yet dialed could still be matched to an earlier slot"""
+        if self.matcher is None:
+            return None
+        with appointments_lock:
+            self.matcher.refresh(appointments_data)
+            return self.matcher.matched
+
+    def save_profile(self):
+        try:
+            path = self.profiler.save()
+        except OSError as e:
+            self.publish({'type': 'error', 'person': '', 'error': f'Could not save campaign profile: {e}'})
+            return
+        if path:
+            self.publish({'type': 'info', 'person': '', 'message': f'Campaign profile saved to {path}'})
+
+    def _run(self, start_row, skip_rows, reattach):
+        call_gate.set_weight(self.campaign_id, self.weight)
+        try:
+            if self.profiler is None:
+                run_campaign(self, start_row, skip_rows, reattach)
+            else:
+                self.profiler.run_dispatcher(run_campaign, self, start_row, skip_rows, reattach)
+        except Exception as e:
+            store.set_campaign_status(self.campaign_id, 'failed')
+            self.publish({'type': 'error', 'person': '', 'error': f'Campaign failed: {str(e)}'})
+        finally:
+            call_gate.forget(self.campaign_id)
+            if self.profiler is not None:
+                self.save_profile()
+            self.status = "Ready"
+            self.finished.set()
+            status_tracker.bump('is_calling', 'active_campaign_id', 'active_campaigns', 'current_status')
+            self.bus.close()
+
+
+class CallWaiter:
+    """Wakes threads waiting on a call when its webhook events arrive"""
+
+    def __init__(self):
+        self.ended = threading.Event()
+        self.analyzed = threading.Event()
+        self.call_data = None
+        self.refs = 0
+
+    def update(self, event, call_data):
+        self.call_data = call_data
+        if event == 'call_analyzed':
+            self.analyzed.set()
+            self.ended.set()
+        elif event == 'call_ended':
+            self.ended.set()
+
+
+# Fields reported by /status; the tracker versions them for ETag and delta responses
+STATUS_FIELDS = [
+    'is_calling', 'active_campaign_id', 'active_campaigns', 'current_status', 'people_count', 'labs',
+    'appointments_count', 'original_appointments_count', 'rescheduled_count', 'slot_conflicts_count',
+    'people_schema', 'appointments_schema'
+]
+status_tracker = StatusTracker(STATUS_FIELDS)
+
+# Persistent state: uploads, attempts and results survive a restart
+store = CampaignStore(CAMPAIGN_DB_PATH)
+
+# Working copies loaded from the store
+people_data = store.load_people()
+appointments_data = store.load_slot_index()
+people_schema = store.get_meta('people_schema', {})
+appointments_schema = store.get_meta('appointments_schema', {})
+# Most recently launched campaign; exports that don't name a campaign_id report its results
+current_campaign_id = store.get_meta('current_campaign_id')
+# Bumped on every people upload so a campaign can't resume against a different list
+people_version = store.get_meta('people_version', 0)
+# Anything still marked running was cut off when the process last stopped
+store.mark_interrupted_campaigns()
+# job_id -> UploadJob for recent uploads
+upload_jobs = OrderedDict()
+upload_jobs_lock = threading.Lock()
+# People uploads share one staging table, so they are ingested one at a time
+people_ingest_lock = threading.Lock()
+
+# campaign_id -> CampaignRunner in launch order: every running campaign, plus recently
+# finished ones so dashboards can still read their events
+campaign_runners = OrderedDict()
+campaign_runners_lock = threading.Lock()
+
+# Shared client for everything that talks to RETELL_API_ROOT
+retell = RetellClient(RETELL_API_KEY)
+# Phone numbers and agent details for the dashboard (loaders registered below)
+metadata_cache = MetadataCache()
+
+# Account-level limits shared by every campaign in this process
+create_call_bucket = TokenBucket(RETELL_CALLS_PER_MINUTE / 60.0, capacity=max(1.0, RETELL_CALLS_PER_MINUTE / 6.0))
+poll_bucket = TokenBucket(RETELL_POLLS_PER_SECOND)
+call_gate = ConcurrencyGate(RETELL_CONCURRENCY_LIMIT)
+
+# Guards appointments_data while calls run concurrently
+appointments_lock = threading.RLock()
+# call_id -> CallWaiter for calls someone is waiting on
+call_waiters = {}
+call_waiters_lock = threading.Lock()
+# Webhook events that arrived before anyone waited on the call (bounded)
+early_call_events = OrderedDict()
+MAX_EARLY_CALL_EVENTS = 1000
+# When the last webhook arrived; polling slows down while webhooks are flowing
+last_webhook_at = 0.0
+
+# call_id -> Future of (HTTP status, body) for /get-call-result; one waiter per call
+call_result_executor = ThreadPoolExecutor(max_workers=MAX_CALL_RESULT_WAITERS, thread_name_prefix='call-result')
+call_result_futures = OrderedDict()
+call_result_futures_lock = threading.Lock()
+
+# One semaphore per caller ID, shared by every campaign using that number
+from_number_semaphores = {}
+from_number_semaphores_lock = threading.Lock()
+
+# When recent calls were created, for the calls-per-minute gauge (only kept while metrics are on)
+recent_call_times = deque(maxlen=10000)
+
+# What /metrics reports; labels are limited to endpoint names, status classes and outcomes
+metrics = Metrics()
+metrics.histogram('retell_request_seconds', 'Retell API request latency by endpoint', LATENCY_BUCKETS,
+                  {'endpoint': RETELL_ENDPOINTS})
+metrics.counter('retell_requests_total', 'Retell API responses by endpoint and status class',
+                {'endpoint': RETELL_ENDPOINTS, 'status': ('2xx', '3xx', '4xx', '429', '5xx', 'network')})
+metrics.counter('retell_retries_total', 'Retell API requests retried after a 429, 5xx or dropped connection',
+                {'endpoint': RETELL_ENDPOINTS})
+metrics.histogram('slot_filter_seconds', 'Time to pick the earlier slots offered on a call', SLOT_BUCKETS)
+metrics.histogram('slot_reserve_seconds', 'Time to find, reserve and save a rescheduled slot', SLOT_BUCKETS)
+metrics.histogram('call_line_wait_seconds', 'Time a call waited for a free line before being created',
+                  WAIT_BUCKETS)
+metrics.histogram('call_polls', 'Call status polls made per call', POLL_BUCKETS)
+metrics.histogram('call_analysis_wait_seconds', 'Time from a call ending until its analysis was available',
+                  WAIT_BUCKETS, {'source': ('ready', 'webhook', 'refetch')})
+metrics.counter('call_analysis_missing_total', 'Calls that ended without analysis in time')
+metrics.counter('calls_created_total', 'Calls created with Retell')
+metrics.counter('call_outcomes_total', 'Recorded results by Outcome', {'outcome': RESULT_OUTCOMES})
+metrics.gauge('calls_per_minute', 'Calls created in the last 60 seconds',
+              lambda: sum(1 for created in list(recent_call_times) if created > time.time() - 60))
+metrics.gauge('calls_in_progress', 'Live calls holding a line', lambda: call_gate.active)
+metrics.gauge('call_line_limit', 'Lines currently allowed (drops when Retell returns 429)', lambda: call_gate.limit)
+metrics.gauge('calls_waiting_for_line', 'Calls queued for a free line', call_gate.queued)
+metrics.gauge('running_campaigns', 'Campaigns still dialing', lambda: len(running_campaigns()))
+metrics.gauge('campaign_people_queued', 'People not yet dialed in running campaigns',
+              lambda: sum(max(0, len(runner.plan) - runner.position) for runner in running_campaigns()))
+metrics.gauge('call_result_lookups_pending', 'Unfinished /get-call-result lookups',
+              lambda: sum(1 for future in list(call_result_futures.values()) if not future.done()))
 
 
 def infer_schema_from_df(df, source_name):
@@ -63,78 +1999,28 @@ def validate_data_against_schema(df, schema, data_type):
     return True, "Schema validated successfully"
 
 
+def build_call_payload(person_data, from_number, offers):
+    """The create-phone-call JSON body offering `offers` (slot records) to `person_data`"""
+    # Format next available appointments as JSON array, from the cached slot fragments
+    offers_json = '[' + ', '.join(apt.table.fragment(apt.row) for apt in offers) + ']'
+    return person_data.render_call_payload(from_number, offers_json)
+
+
 def create_phone_call(person_data, available_appointments, from_number):
     """Create a phone call via Retell AI API"""
     
-    # Prepare dynamic variables
-    dynamic_vars = {}
-    
-    # Map person data to dynamic variables
-    if 'Patient-First' in person_data:
-        dynamic_vars['Patient-First'] = str(person_data['Patient-First'])
-    if 'Patient-Last' in person_data:
-        dynamic_vars['Patient-Last'] = str(person_data['Patient-Last'])
-    if 'Date_of_Birth' in person_data:
-        dynamic_vars['Date_of_Birth'] = str(person_data['Date_of_Birth'])
-    if 'Lab_Name' in person_data:
-        dynamic_vars['Lab_Name'] = str(person_data['Lab_Name'])
-    if 'Lab_Phone' in person_data:
-        dynamic_vars['Lab_Phone'] = str(person_data['Lab_Phone'])
-    if 'Test_Type' in person_data:
-        dynamic_vars['Test_Type'] = str(person_data['Test_Type'])
-    if 'Extracted_Appointment_Date' in person_data:
-        dynamic_vars['Extracted_Appointment_Date'] = str(person_data['Extracted_Appointment_Date'])
-    if 'Appointment_Day_Of_Week' in person_data:
-        dynamic_vars['Appointment_Day_Of_Week'] = str(person_data['Appointment_Day_Of_Week'])
-    if 'Appointment_Month' in person_data:
-        dynamic_vars['Appointment_Month'] = str(person_data['Appointment_Month'])
-    if 'Appointment_Day_Of_Month' in person_data:
-        dynamic_vars['Appointment_Day_Of_Month'] = str(person_data['Appointment_Day_Of_Month'])
-    if 'Is_Tonight' in person_data:
-        dynamic_vars['Is_Tonight'] = str(person_data['Is_Tonight'])
-    if 'Is_Tomorrow' in person_data:
-        dynamic_vars['Is_Tomorrow'] = str(person_data['Is_Tomorrow'])
-    
-    # Format next available appointments as JSON array
-    appointments_list = []
-    for apt in available_appointments:
-        # apt is already a dict, just convert values to strings
-        apt_obj = {key: str(value) for key, value in apt.items()}
-        appointments_list.append(apt_obj)
-    
-    dynamic_vars['Next_Open_Appointments'] = json.dumps(appointments_list)
-    
-    # Get phone number
-    phone_number = person_data.get('phone number', '')
-    if not phone_number:
+    # Phone number was normalized to E.164 at load
+    if not person_data.phone:
         raise ValueError("No phone number found in person data")
+
+    payload = build_call_payload(person_data, from_number, available_appointments)
     
-    # Convert to string and clean
-    phone_number = str(phone_number).strip()
-    
-    # Ensure E.164 format
-    if not phone_number.startswith('+'):
-        phone_number = '+' + phone_number.replace('(', '').replace(')', '').replace(' ', '').replace('-', '')
-    
-    # Create call payload
-    payload = {
-        "from_number": from_number,
-        "to_number": phone_number,
-        "override_agent_id": RETELL_AGENT_ID,
-        "retell_llm_dynamic_variables": dynamic_vars
-    }
-    
-    headers = {
-        "Authorization": f"Bearer {RETELL_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    response = requests.post(
-        f"{RETELL_API_BASE}/create-phone-call",
-        headers=headers,
-        json=payload
-    )
-    
+    response = retell.post("/v2/create-phone-call", 'create-phone-call', data=payload.encode(),
+                           headers={'Content-Type': 'application/json'}, rate_limiter=create_call_bucket)
+
+    if response.status_code == 429:
+        raise RateLimitedError(f"Failed to create call: {response.status_code} - {response.text}")
+
     if response.status_code != 201:
         raise Exception(f"Failed to create call: {response.status_code} - {response.text}")
     
@@ -143,14 +2029,13 @@ def create_phone_call(person_data, available_appointments, from_number):
 
 def get_call_status(call_id):
     """Get call status from Retell AI"""
-    headers = {
-        "Authorization": f"Bearer {RETELL_API_KEY}"
-    }
-    
-    response = requests.get(
-        f"{RETELL_API_BASE}/get-call/{call_id}",
-        headers=headers
-    )
+    import requests
+
+    try:
+        response = retell.get(f"/v2/get-call/{call_id}", 'get-call', rate_limiter=poll_bucket)
+    except requests.RequestException:
+        # Treat a network failure like a missed poll; the caller will try again
+        return None
     
     if response.status_code == 200:
         return response.json()
@@ -158,28 +2043,165 @@ def get_call_status(call_id):
     return None
 
 
+def fetch_phone_numbers():
+    """Fetch the account's phone numbers from Retell AI, formatted for the dropdown"""
+    response = retell.get("/list-phone-numbers", 'list-phone-numbers')
+
+    if response.status_code != 200:
+        raise RetellAPIError(f'Failed to fetch phone numbers: {response.status_code}', response.status_code)
+
+    return [{
+        'phone_number': num.get('phone_number', ''),
+        'phone_number_pretty': num.get('phone_number_pretty', num.get('phone_number', '')),
+        'nickname': num.get('nickname', ''),
+        'area_code': num.get('area_code', '')
+    } for num in response.json()]
+
+
+def fetch_agent():
+    """Fetch the configured agent's details from Retell AI"""
+    response = retell.get(f"/get-agent/{RETELL_AGENT_ID}", 'get-agent')
+
+    if response.status_code != 200:
+        raise RetellAPIError(f'Failed to fetch agent: {response.status_code}', response.status_code)
+
+    agent = response.json()
+    return {
+        'agent_id': agent.get('agent_id', RETELL_AGENT_ID),
+        'agent_name': agent.get('agent_name') or '',
+        'voice_id': agent.get('voice_id', ''),
+        'language': agent.get('language', '')
+    }
+
+
+metadata_cache.register('phone_numbers', fetch_phone_numbers)
+metadata_cache.register('agent', fetch_agent)
+
+
+def acquire_call_waiter(call_id):
+    """Register interest in a call's webhook events"""
+    with call_waiters_lock:
+        waiter = call_waiters.get(call_id)
+        if waiter is None:
+            waiter = CallWaiter()
+            call_waiters[call_id] = waiter
+            # Replay anything that arrived before we started waiting
+            for event, call_data in early_call_events.pop(call_id, []):
+                waiter.update(event, call_data)
+        waiter.refs += 1
+        return waiter
+
+
+def release_call_waiter(call_id):
+    """Drop interest in a call's webhook events"""
+    with call_waiters_lock:
+        waiter = call_waiters.get(call_id)
+        if waiter is not None:
+            waiter.refs -= 1
+            if waiter.refs <= 0:
+                del call_waiters[call_id]
+
+
+def notify_call_event(event, call_data):
+    """Hand a webhook event to whoever is waiting on the call"""
+    global last_webhook_at
+
+    call_id = call_data.get('call_id')
+    if not call_id:
+        return
+
+    with call_waiters_lock:
+        last_webhook_at = time.time()
+        waiter = call_waiters.get(call_id)
+        if waiter is not None:
+            waiter.update(event, call_data)
+            return
+
+        early_call_events.setdefault(call_id, []).append((event, call_data))
+        early_call_events.move_to_end(call_id)
+        while len(early_call_events) > MAX_EARLY_CALL_EVENTS:
+            early_call_events.popitem(last=False)
+
+
+def webhooks_active():
+    """Whether Retell webhooks have reached us in the last hour"""
+    return time.time() - last_webhook_at < 3600
+
+
+def wait_for_call_analysis(call_id, waiter, call_data, timeout):
+    """Wait for the call_analyzed webhook, falling back to one more fetch"""
+    if call_data and call_data.get('call_analysis'):
+        metrics.observe('call_analysis_wait_seconds', 0.0, source='ready')
+        return call_data
+
+    start = time.perf_counter()
+    if waiter.analyzed.wait(timeout=timeout):
+        metrics.observe('call_analysis_wait_seconds', time.perf_counter() - start, source='webhook')
+        return waiter.call_data
+
+    # Fetch again to get complete analysis
+    final_call_data = get_call_status(call_id)
+    if final_call_data and final_call_data.get('call_analysis'):
+        metrics.observe('call_analysis_wait_seconds', time.perf_counter() - start, source='refetch')
+    else:
+        metrics.inc('call_analysis_missing_total')
+    return final_call_data if final_call_data else call_data
+
+
 def poll_call_until_ended(call_id, max_wait_seconds=600, poll_interval=5):
-    """Poll call status until it ends"""
+    """Wait for a call to end, woken by webhooks and polling with exponential backoff"""
     start_time = time.time()
-    
-    while time.time() - start_time < max_wait_seconds:
-        call_data = get_call_status(call_id)
-        
-        if call_data:
-            status = call_data.get('call_status')
-            
-            if status in ['ended', 'error']:
-                # Wait additional time for post-call analysis to complete
-                # Analysis may take a few seconds after call ends
-                time.sleep(3)
-                
-                # Fetch again to get complete analysis
-                final_call_data = get_call_status(call_id)
-                return final_call_data if final_call_data else call_data
-        
-        time.sleep(poll_interval)
-    
-    return None
+    interval = poll_interval
+    polls = 0
+    waiter = acquire_call_waiter(call_id)
+
+    try:
+        while time.time() - start_time < max_wait_seconds:
+            # Webhook already told us the call is over
+            if waiter.ended.is_set():
+                return wait_for_call_analysis(call_id, waiter, waiter.call_data, CALL_ANALYSIS_WAIT_SECONDS)
+
+            call_data = get_call_status(call_id)
+            polls += 1
+
+            if call_data:
+                status = call_data.get('call_status')
+
+                if status in ['ended', 'error']:
+                    # Analysis may take a few seconds after call ends; with webhooks
+                    # flowing, call_analyzed arrives on its own
+                    analysis_wait = CALL_ANALYSIS_WAIT_SECONDS if webhooks_active() else 3
+                    return wait_for_call_analysis(call_id, waiter, call_data, analysis_wait)
+
+            # Sleep until the next poll unless a webhook wakes us first
+            remaining = max_wait_seconds - (time.time() - start_time)
+            waiter.ended.wait(timeout=max(0, min(interval, remaining)))
+
+            max_interval = CALL_POLL_MAX_INTERVAL_WITH_WEBHOOKS if webhooks_active() else CALL_POLL_MAX_INTERVAL
+            interval = min(interval * 2, max(max_interval, poll_interval))
+
+        return None
+    finally:
+        release_call_waiter(call_id)
+        metrics.observe('call_polls', polls)
+
+
+def verify_retell_signature(body, signature):
+    """Check an x-retell-signature header (v=<ms timestamp>,d=<hex digest>) against our API key"""
+    match = re.fullmatch(r'v=(\d+),d=([0-9a-fA-F]+)', signature or '')
+    if not match or not RETELL_API_KEY:
+        return False
+
+    # Reject replays older than five minutes
+    if abs(time.time() * 1000 - int(match.group(1))) > 5 * 60 * 1000:
+        return False
+
+    expected = hmac.new(
+        RETELL_API_KEY.encode(),
+        body + match.group(1).encode(),
+        hashlib.sha256
+    ).hexdigest()
+    return hmac.compare_digest(expected, match.group(2).lower())
 
 
 def extract_appointment_from_analysis(call_data):
@@ -236,207 +2258,716 @@ def extract_appointment_from_analysis(call_data):
     return result
 
 
-def find_and_remove_appointment(new_date):
-    """Find and remove the matching appointment from available slots"""
-    global appointments_data, rescheduled_count
+def find_and_remove_appointment(new_date, call_id=None, lab=None):
+    """Find and remove the matching appointment from available slots (only `lab`'s, if given)
+
+    Returns (removed, claimed_by); claimed_by is the call that already took
+    the slot when two calls booked it at nearly the same time.
+    """
+    with metrics.timer('slot_reserve_seconds'), appointments_lock:
+        if not new_date:
+            return False, None
+
+        status, claimed_by, slot_id = appointments_data.reserve(new_date, call_id, lab)
+        if status == 'reserved':
+            store.claim_slot(slot_id, call_id)
+            status_tracker.bump('appointments_count', 'rescheduled_count')
+        elif status == 'conflict':
+            status_tracker.bump('slot_conflicts_count')
+        return status in ('reserved', 'already_reserved'), claimed_by
+
+
+def record_result(campaign_id, person_row, call_id, result, attempt_id=None):
+    """Store a final result and let /status pollers know the count moved
+
+    Returns None without storing anything when the call already has a result.
+    """
+    seq = store.add_result(campaign_id, person_row, call_id, result, attempt_id)
+    if seq is None:
+        return None
+    # Results counts are reported per campaign in active_campaigns
+    status_tracker.bump('active_campaigns')
+    metrics.inc('call_outcomes_total', outcome=result.get('Outcome'))
+    # Pre-render full segments so exports mid-campaign only format the newest results
+    store.seal_result_segments(campaign_id, RESULT_SEGMENT_ROWS, render_result_segment)
+    return seq
+
+
+def create_phone_call_when_allowed(person_data, available_appointments, from_number, owner=None):
+    """Create a call once the account has a free line, waiting out 429s instead of failing the patient
+
+    On success the caller holds a call_gate slot for `owner` (the campaign) and must
+    release it when the call ends.
+    """
+    deadline = time.time() + CREATE_CALL_MAX_THROTTLE_WAIT
+
+    while True:
+        with metrics.timer('call_line_wait_seconds'):
+            call_gate.acquire(owner)
+        try:
+            call_response = create_phone_call(person_data, available_appointments, from_number)
+        except RateLimitedError:
+            # The gate tightens to the calls still running, so we wait for one of them to end
+            call_gate.release(throttled=True, owner=owner)
+            if time.time() > deadline:
+                raise
+            continue
+        except Exception:
+            call_gate.release(owner=owner)
+            raise
+
+        call_gate.record_success()
+        metrics.inc('calls_created_total')
+        if metrics.enabled:
+            recent_call_times.append(time.time())
+        return call_response
+
+
+def get_from_number_semaphore(from_number):
+    """Get the semaphore that caps concurrent calls from one caller ID"""
+    with from_number_semaphores_lock:
+        semaphore = from_number_semaphores.get(from_number)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(MAX_CALLS_PER_FROM_NUMBER)
+            from_number_semaphores[from_number] = semaphore
+        return semaphore
+
+
+def get_earlier_appointments(person, limit=5, holder=None, lab=None, matcher=None):
+    """Get up to `limit` open slots (of `lab`, if given) earlier than the person's current appointment
+
+    Slots held for other calls in progress are left out; passing `holder` holds the
+    returned slots until release_slot_holds(holder). With a SlotMatcher, the slots it
+    matched the person to come first.
+    """
+    # Current appointment time was parsed when the list was loaded
+    current_ts = person.appointment_ts
+
+    with metrics.timer('slot_filter_seconds'), appointments_lock:
+        prefer = ()
+        if matcher is not None:
+            matcher.refresh(appointments_data)
+            prefer = matcher.preferred(person.row, current_ts)
+
+        if current_ts is not None:
+            # Only include appointments BEFORE current appointment
+            slots = appointments_data.earlier_than(current_ts, limit, lab=lab, prefer=prefer)
+        else:
+            # If no current appointment date (or it can't be read), use the earliest appointments
+            slots = appointments_data.first(limit, lab=lab, prefer=prefer)
+
+        if holder is not None:
+            appointments_data.hold(slots, holder)
+        return slots
+
+
+def earlier_slots_on_hold(person, lab=None):
+    """Whether the person's only earlier slots are held for calls still in progress"""
+    current_ts = person.appointment_ts
+
+    with appointments_lock:
+        if current_ts is not None:
+            return bool(appointments_data.earlier_than(current_ts, 1, include_held=True, lab=lab))
+        return bool(appointments_data.first(1, include_held=True, lab=lab))
+
+
+def release_slot_holds(holder):
+    with appointments_lock:
+        appointments_data.release(holder)
+
+
+def plan_call_order(people, ordering, lab=None):
+    """The people rows a campaign dials, in order (only `lab`'s people, if given)"""
+    if lab is None:
+        rows = list(range(len(people)))
+    else:
+        rows = [row for row, person_lab in enumerate(people.labs) if person_lab == lab]
+
+    if ordering == 'file':
+        return rows
+
+    # People whose current appointment is soonest have the fewest earlier slots to choose
+    # from, so they go first; later people can still use whatever slots are left.
+    # People with no readable current appointment can take any slot and go last.
+    current = people.appointment_ts
+    return sorted(rows, key=lambda row: (current[row] is None, current[row] or 0))
+
+
+class SlotMatcher:
+    """Greedy deadline matching of a campaign's people not yet dialed to the open slots
+
+    Everyone is matched soonest current appointment first, each to the earliest open slot
+    before it, and people with no readable appointment take what is left; that gives the
+    most people an earlier slot. Offers start with the person's own assigned slot, then
+    slots nobody was assigned, so whoever is dialed doesn't use up the slots that people
+    with nearer appointments depend on. The matching is redone once a slot is reserved or
+    released. refresh() and preferred() need appointments_lock held.
+    """
+
+    def __init__(self, people, rows, lab=None):
+        import numpy as np
+
+        current = people.appointment_ts
+        timed = sorted((current[row], row) for row in rows if current[row] is not None)
+        self._rows = [row for _, row in timed] + [row for row in rows if current[row] is None]
+        self._deadlines = np.array([ts for ts, _ in timed], dtype='int64')
+        self._position = {row: i for i, row in enumerate(self._rows)}
+        self._done = np.zeros(len(self._rows), dtype=bool)
+        self.lab = lab
+        self._index = None
+        self._version = None
+        # Slot id assigned to each person (by position in _rows), -1 for none
+        self._assigned = np.full(len(self._rows), -1, dtype='int64')
+        # Slot ids nobody was assigned, in date order, and their timestamps
+        self._spare = self._assigned[:0]
+        self._spare_ts = self._deadlines[:0]
+        self.matched = 0
+
+    def finish(self, row):
+        """Leave a person out of the matching once they have been dialed or skipped"""
+        position = self._position.get(row)
+        if position is not None:
+            self._done[position] = True
+
+    def refresh(self, index):
+        """Redo the matching if slots were reserved or released since it was last done"""
+        import numpy as np
+
+        if index is self._index and index.version == self._version:
+            return
+        live = ~self._done
+        timed_live = live[:len(self._deadlines)]
+        assigned, spare = index.match(self._deadlines[timed_live], int(live[len(self._deadlines):].sum()), self.lab)
+
+        self._assigned = np.full(len(self._rows), -1, dtype='int64')
+        self._assigned[live] = assigned
+        self._spare = spare
+        self._spare_ts = index._ts_array[spare]
+        self.matched = int((assigned >= 0).sum())
+        self._index, self._version = index, index.version
+
+    def preferred(self, row, timestamp):
+        """Slot ids to offer a person first: their assigned slot, then spare slots before `timestamp`"""
+        position = self._position.get(row)
+        slot_id = int(self._assigned[position]) if position is not None else -1
+        hi = len(self._spare) if timestamp is None else int(self._spare_ts.searchsorted(timestamp, 'left'))
+        spare = map(int, itertools.islice(self._spare, hi))
+        return itertools.chain((slot_id,), spare) if slot_id >= 0 else spare
+
+
+def process_person_call(campaign_id, person_row, person, person_name, available_apts, from_num, events,
+                        attempt_id=None, call_id=None, lab_name=None):
+    """Dial one person, wait for the call to end and record the result (runs on a worker thread)
+
+    Passing call_id/attempt_id reattaches to a call that was already live when the
+    campaign was interrupted instead of dialing again.
+    """
+    try:
+        # Hold a line on this caller ID for the whole call
+        with get_from_number_semaphore(from_num):
+            holds_call_gate = False
+            try:
+                if call_id is None:
+                    events.put({
+                        'type': 'calling',
+                        'person': person_name,
+                        'phone': person.phone
+                    })
 
-    if not new_date or not appointments_data:
-        return False
+                    # Checkpoint the attempt before dialing so a crash never re-dials this person
+                    if attempt_id is None:
+                        attempt_id = store.start_attempt(campaign_id, person_row)
+                    store.mark_attempt_dialing(attempt_id)
 
-    # Try to parse and match the date
-    for i, apt in enumerate(appointments_data):
-        apt_date = apt.get('date', '')
+                    # Create call
+                    call_response = create_phone_call_when_allowed(person, available_apts, from_num, campaign_id)
+                    holds_call_gate = True
+                    call_id = call_response['call_id']
+                    store.set_attempt_call(attempt_id, call_id)
 
-        # Direct match
-        if str(apt_date) == str(new_date):
-            appointments_data.pop(i)
-            rescheduled_count += 1
-            return True
+                    events.put({
+                        'type': 'call_created',
+                        'call_id': call_id,
+                        'person': person_name
+                    })
+                else:
+                    # The call is still live on the account, so it holds a line too
+                    call_gate.acquire(campaign_id)
+                    holds_call_gate = True
 
-        # Try fuzzy matching
-        try:
-            parsed_new = pd.to_datetime(new_date)
-            parsed_apt = pd.to_datetime(apt_date)
-            if parsed_new.date() == parsed_apt.date():
-                appointments_data.pop(i)
-                rescheduled_count += 1
-                return True
-        except:
-            continue
+                    events.put({
+                        'type': 'call_resumed',
+                        'call_id': call_id,
+                        'person': person_name
+                    })
+
+                # Poll until call ends
+                call_data = poll_call_until_ended(call_id)
+
+                if not call_data:
+                    result = {
+                        'Patient Name': person_name,
+                        'Patient DOB': person.get('Date_of_Birth', ''),
+                        'Call Successful': False,
+                        'In Voicemail': False,
+                        'User Sentiment': '',
+                        'Appointment Confirmed': '',
+                        'Appointment Rescheduled': False,
+                        'New Appointment Date': '',
+                        'Call Summary': 'Call timed out',
+                        'Detailed Call Summary': '',
+                        'To-do List': '',
+                        'Asked for DNC': False,
+                        'Recording URL': '',
+                        'Outcome': 'timeout'
+                    }
+                else:
+                    # Extract analysis
+                    analysis = extract_appointment_from_analysis(call_data)
+
+                    result = {
+                        'Patient Name': person_name,
+                        'Patient DOB': analysis['patient_dob'] or person.get('Date_of_Birth', ''),
+                        'Call Successful': analysis['call_successful'],
+                        'In Voicemail': analysis['in_voicemail'],
+                        'User Sentiment': analysis['user_sentiment'],
+                        'Appointment Confirmed': analysis['appointment_confirmed'],
+                        'Appointment Rescheduled': analysis['appointment_rescheduled'],
+                        'New Appointment Date': analysis['new_appointment_date'] or '',
+                        'Call Summary': analysis['call_summary'],
+                        'Detailed Call Summary': analysis['detailed_call_summary'],
+                        'To-do List': analysis['to_do_list'],
+                        'Asked for DNC': analysis['asked_for_dnc'],
+                        'Recording URL': call_data.get('recording_url', ''),
+                        'Outcome': 'rescheduled' if analysis['appointment_rescheduled'] else 'no_reschedule'
+                    }
 
-    return False
+                    # Remove appointment if rescheduled
+                    if analysis['appointment_rescheduled'] and analysis['new_appointment_date']:
+                        removed, claimed_by = find_and_remove_appointment(analysis['new_appointment_date'], call_id,
+                                                                          lab_name)
+                        if removed:
+                            result['Appointment Slot Removed'] = True
+                        elif claimed_by:
+                            result['Slot Conflict'] = f'Slot already claimed by call {claimed_by}'
+                            result['Outcome'] = 'rescheduled_conflict'
+
+                record_result(campaign_id, person_row, call_id, result, attempt_id)
+
+                events.put({
+                    'type': 'call_complete',
+                    'call_id': call_id,
+                    'result': result
+                })
+
+            except Exception as e:
+                result = {
+                    'Patient Name': person_name,
+                    'Patient DOB': person.get('Date_of_Birth', ''),
+                    'Call Successful': False,
+                    'In Voicemail': False,
+                    'User Sentiment': '',
+                    'Appointment Confirmed': '',
+                    'Appointment Rescheduled': False,
+                    'New Appointment Date': '',
+                    'Call Summary': f'Error: {str(e)}',
+                    'Detailed Call Summary': '',
+                    'To-do List': '',
+                    'Asked for DNC': False,
+                    'Recording URL': '',
+                    'Outcome': 'error'
+                }
+                record_result(campaign_id, person_row, call_id, result, attempt_id)
+
+                events.put({
+                    'type': 'error',
+                    'call_id': call_id,
+                    'person': person_name,
+                    'error': str(e)
+                })
+            finally:
+                # The call no longer counts against the account concurrency limit
+                if holds_call_gate:
+                    call_gate.release(owner=campaign_id)
+    finally:
+        # Slots offered on this call can be offered to the next people
+        release_slot_holds((campaign_id, person_row))
+        # Tell the dispatcher this line is free again
+        events.put(None)
 
 
 @app.route('/')
 def index():
-    """Render the main dashboard"""
-    return render_template('index.html')
+    """Render the main dashboard, with whatever Retell metadata is already cached"""
+    return render_template('index.html', phone_numbers=metadata_cache.peek('phone_numbers'),
+                           agent=metadata_cache.peek('agent'))
+
+
+def csv_row_index(path, size):
+    """Index that numbers a CSV's data rows as in the file (spreadsheet row - 2), or None
+
+    pandas drops blank lines, so the rows it reads no longer line up with the file once
+    there is one. Returns None, without reading the file as CSV, when it has none.
+    """
+    import mmap
+    import numpy as np
+
+    if not size:
+        return None
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if CSV_BLANK_LINE.search(data) is None:
+            return None
+
+    index = []
+    header_row = None
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        for row_number, record in enumerate(csv.reader(f), start=1):
+            if not record or (len(record) == 1 and not record[0].strip()):
+                continue
+            if header_row is None:
+                header_row = row_number
+            else:
+                index.append(row_number - 2)
+    return np.array(index, dtype='int64') if header_row is not None else None
+
+
+def read_upload_chunks(job):
+    """Yield dataframes of up to UPLOAD_CHUNK_ROWS rows from an uploaded file, updating job progress
+
+    Each chunk's index is the row's spreadsheet row number minus 2 (the header is row 1),
+    blank rows included, so rows can be reported back by the number the user sees.
+    """
+    import pandas as pd
+
+    name = job.filename.lower()
+
+    if name.endswith('.csv'):
+        row_index = csv_row_index(job.path, job.size)
+        with open(job.path, 'rb') as f:
+            for chunk in pd.read_csv(f, chunksize=UPLOAD_CHUNK_ROWS):
+                job.progress = f.tell() / job.size if job.size else 1.0
+                if row_index is not None:
+                    chunk.index = row_index[chunk.index.to_numpy()]
+                yield chunk
+
+    elif name.endswith('.xlsx'):
+        # Read-only mode streams rows from the sheet instead of loading the whole workbook
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(job.path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [str(c) if c is not None else f'Unnamed: {i}' for i, c in enumerate(header)]
+            width = len(columns)
+            total_rows = max((sheet.max_row or 0) - 1, 1)
+
+            batch = []
+            positions = []
+            for position, row in enumerate(rows):
+                # Skip blank rows like pandas does
+                if all(value is None for value in row):
+                    continue
+                batch.append(tuple(row[:width]) + (None,) * (width - len(row)))
+                positions.append(position)
+                if len(batch) == UPLOAD_CHUNK_ROWS:
+                    job.progress = min(1.0, (job.rows + len(batch)) / total_rows)
+                    yield pd.DataFrame(batch, columns=columns, index=positions).infer_objects()
+                    batch = []
+                    positions = []
+            if batch:
+                yield pd.DataFrame(batch, columns=columns, index=positions).infer_objects()
+        finally:
+            workbook.close()
 
+    else:
+        # Legacy .xls has no streaming reader; it is read in one piece (blank rows are kept)
+        yield pd.read_excel(job.path)
 
-@app.route('/upload-people', methods=['POST'])
-def upload_people():
-    """Upload people to call list"""
-    global people_data, people_schema
-    
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-        
-        file = request.files['file']
-        
-        # Read file based on extension
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(file)
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file)
-        else:
-            return jsonify({'error': 'Unsupported file format. Use CSV or Excel'}), 400
-        
-        # Infer schema if this is the first upload
-        if not people_schema:
-            people_schema = infer_schema_from_df(df, file.filename)
-        else:
-            # Validate against existing schema
-            valid, msg = validate_data_against_schema(df, people_schema, 'People')
-            if not valid:
-                return jsonify({'error': msg}), 400
-        
-        # Convert to list of dicts
-        people_data = df.to_dict('records')
-        
-        return jsonify({
-            'success': True,
+
+def check_upload_schema(df, schema, data_type, filename):
+    """Validate the first chunk of an upload, returning the schema to use for it"""
+    if not schema:
+        return infer_schema_from_df(df, filename)
+
+    valid, msg = validate_data_against_schema(df, schema, data_type)
+    if not valid:
+        raise ValueError(msg)
+    return schema
+
+
+def build_phone_report(phones, row_index=None):
+    """Summarize unusable and shared phone numbers by spreadsheet row number
+
+    `row_index` gives each phone's row as read_upload_chunks indexes it; by default
+    the phones are taken to be every row of the file in order.
+    """
+    import pandas as pd
+
+    phones = pd.Series(phones, index=row_index, dtype=object)
+    invalid_rows = (phones.index[phones.eq('').to_numpy()] + 2).tolist()
+
+    # The same number under several patients (households, shared cell phones)
+    shared = phones[phones.ne('') & phones.duplicated(keep=False)]
+    duplicate_groups = [(shared.index[rows] + 2).tolist()
+                        for rows in shared.groupby(shared, sort=False).indices.values()]
+
+    return {
+        'invalid_count': len(invalid_rows),
+        'invalid_rows': invalid_rows[:50],
+        'duplicate_number_count': len(duplicate_groups),
+        'duplicate_rows': duplicate_groups[:50]
+    }
+
+
+def ingest_people(job):
+    """Stream an uploaded people file into the store, then make it the call list"""
+    global people_data, people_schema, people_version
+
+    with people_ingest_lock:
+        schema = None
+        table = PeopleTable()
+        row_index = []
+        store.begin_people_upload()
+
+        for chunk in read_upload_chunks(job):
+            if schema is None:
+                schema = check_upload_schema(chunk, people_schema, 'People', job.filename)
+
+            store.stage_people(len(table), chunk.to_dict('records'))
+            table.append_frame(chunk)
+            row_index.extend(chunk.index.tolist())
+            job.rows = len(table)
+
+        if schema is None:
+            raise ValueError('The file has no rows')
+
+        phone_report = build_phone_report(table.phones, row_index)
+
+        store.finish_people_upload()
+        people_data = table
+        if schema is not people_schema:
+            people_schema = schema
+            store.set_meta('people_schema', people_schema)
+            status_tracker.bump('people_schema')
+        people_version += 1
+        store.set_meta('people_version', people_version)
+        status_tracker.bump('people_count', 'labs')
+
+        return {
             'count': len(people_data),
-            'schema': people_schema
-        })
-    
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+            'schema': people_schema,
+            'phone_report': phone_report
+        }
 
 
-@app.route('/upload-appointments', methods=['POST'])
-def upload_appointments():
-    """Upload available appointments"""
-    global appointments_data, appointments_schema, original_appointments_count, rescheduled_count
+def ingest_appointments(job):
+    """Stream an uploaded appointments file into a sorted slot index, then make it the open slots"""
+    global appointments_data, appointments_schema
+
+    state = {'schema': None}
+
+    def validated_chunks():
+        for chunk in read_upload_chunks(job):
+            if state['schema'] is None:
+                state['schema'] = check_upload_schema(chunk, appointments_schema, 'Appointments', job.filename)
+            job.rows += len(chunk)
+            yield chunk
+
+    # Parse every slot date once and keep the slots sorted by date
+    slot_index, unparsed_rows = SlotIndex.from_chunks(validated_chunks())
+    if state['schema'] is None:
+        raise ValueError('The file has no rows')
+
+    with appointments_lock:
+        appointments_data = slot_index
+        # Replacing the stored slots also resets the original and rescheduled counts
+        store.replace_slots(slot_index)
+        if state['schema'] is not appointments_schema:
+            appointments_schema = state['schema']
+            store.set_meta('appointments_schema', appointments_schema)
+            status_tracker.bump('appointments_schema')
+        status_tracker.bump('appointments_count', 'original_appointments_count', 'rescheduled_count',
+                            'slot_conflicts_count')
+
+    return {
+        'count': len(appointments_data),
+        'unparsed_count': len(unparsed_rows),
+        'unparsed_rows': unparsed_rows[:50],
+        'schema': appointments_schema
+    }
+
 
+def run_upload_job(job, ingest):
+    """Run an ingest function for a job on a background thread"""
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
+        job.status = 'running'
+        job.result = ingest(job)
+        job.progress = 1.0
+        job.status = 'done'
+    except Exception as e:
+        job.error = str(e)
+        job.status = 'failed'
+    finally:
+        try:
+            os.remove(job.path)
+        except OSError:
+            pass
 
-        file = request.files['file']
 
-        # Read file based on extension
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(file)
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file)
-        else:
-            return jsonify({'error': 'Unsupported file format. Use CSV or Excel'}), 400
+def start_upload_job(kind, ingest):
+    """Save the uploaded file to disk and ingest it in the background"""
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file provided'}), 400
 
-        # Infer schema if this is the first upload
-        if not appointments_schema:
-            appointments_schema = infer_schema_from_df(df, file.filename)
-        else:
-            # Validate against existing schema
-            valid, msg = validate_data_against_schema(df, appointments_schema, 'Appointments')
-            if not valid:
-                return jsonify({'error': msg}), 400
+    file = request.files['file']
 
-        # Convert to list of dicts
-        appointments_data = df.to_dict('records')
+    # Check the extension before accepting the file
+    if not file.filename.lower().endswith(('.csv', '.xlsx', '.xls')):
+        return jsonify({'error': 'Unsupported file format. Use CSV or Excel'}), 400
 
-        # Track original count and reset rescheduled count
-        original_appointments_count = len(appointments_data)
-        rescheduled_count = 0
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(file.filename)[1])
+    os.close(fd)
+    file.save(path)
 
-        return jsonify({
-            'success': True,
-            'count': len(appointments_data),
-            'schema': appointments_schema
-        })
-    
+    job = UploadJob(kind, file.filename, path)
+    with upload_jobs_lock:
+        upload_jobs[job.job_id] = job
+        while len(upload_jobs) > MAX_RETAINED_UPLOAD_JOBS:
+            upload_jobs.popitem(last=False)
+
+    threading.Thread(target=run_upload_job, args=(job, ingest), name=f'upload-{job.job_id}', daemon=True).start()
+
+    return jsonify({
+        'success': True,
+        'job_id': job.job_id,
+        'status_url': f'/upload-jobs/{job.job_id}'
+    }), 202
+
+
+@app.route('/upload-people', methods=['POST'])
+def upload_people():
+    """Upload people to call list (ingested in the background; poll the returned job)"""
+    try:
+        return start_upload_job('people', ingest_people)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/start-calling', methods=['POST'])
-def start_calling():
-    """Start the sequential calling process"""
-    global is_calling, call_results, people_data, appointments_data
+@app.route('/upload-appointments', methods=['POST'])
+def upload_appointments():
+    """Upload available appointments (ingested in the background; poll the returned job)"""
+    try:
+        return start_upload_job('appointments', ingest_appointments)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-    # Get from_number from request (must be done BEFORE generator)
-    data = request.get_json() or {}
-    from_number = data.get('from_number')
 
-    if not from_number:
-        return jsonify({'error': 'No from_number provided. Please select a phone number.'}), 400
+@app.route('/upload-jobs/<job_id>', methods=['GET'])
+def get_upload_job(job_id):
+    """Get an upload job's progress and, once done, its result"""
+    job = upload_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Upload job not found'}), 404
+    return jsonify(job.to_dict())
 
-    if is_calling:
-        return jsonify({'error': 'Calling process already in progress'}), 400
 
-    if not people_data:
-        return jsonify({'error': 'No people data loaded'}), 400
+def run_campaign(runner, start_row=0, skip_rows=(), reattach=()):
+    """Dial the people list with up to runner.max_in_flight calls at once, checkpointing as it goes
 
-    if not appointments_data:
-        return jsonify({'error': 'No appointments data loaded'}), 400
+    start_row is a position in the campaign's dialing order (see plan_call_order).
+    """
+    campaign_id = runner.campaign_id
+    from_num = runner.from_number
+    max_in_flight = runner.max_in_flight
+    lab = runner.lab_name
 
-    def generate(from_num):
-        """Inner generator function for streaming responses"""
-        global is_calling, call_results, appointments_data, current_status
+    # Worker threads report back through this queue; None means a call slot freed up
+    events = queue.Queue()
+    executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='campaign-call')
+    # Call workers run under the campaign's profiler too, when it has one
+    dial = process_person_call if runner.profiler is None else partial(runner.profiler.run, process_person_call)
+    people = people_data
+    plan = plan_call_order(people, runner.ordering, lab)
+    runner.plan = plan
+    in_flight = 0
 
-        is_calling = True
-        call_results = []
-        current_status = "Starting"
+    try:
+        # Pick calls that were live when the campaign was interrupted back up first
+        for attempt_id, person_row, call_id in reattach:
+            person = people[person_row] if person_row is not None and person_row < len(people) else {}
+            person_name = f"{person.get('Patient-First', '')} {person.get('Patient-Last', '')}".strip()
+            executor.submit(dial, campaign_id, person_row, person, person_name,
+                            [], from_num, events, attempt_id, call_id, lab)
+            in_flight += 1
+
+        next_row = runner.position = start_row
+        dispatching = True
+        # Plan positions of people whose earlier slots were all on offer to calls in progress;
+        # they are tried again, ahead of everyone after them, once a call ends and frees its slots
+        deferred = []
+        retrying = deque()
+
+        def checkpoint():
+            # Stays before anyone deferred, so a resume still dials them
+            store.checkpoint(campaign_id, min([next_row, *deferred, *retrying]))
+
+        # Match the people still to dial to slots up front; offers follow the matching
+        remaining = [row for row in plan[start_row:] if row not in skip_rows]
+        runner.matcher = SlotMatcher(people, remaining, lab)
+        runner.status = f"{in_flight} call(s) in progress"
+        runner.publish({
+            'type': 'info',
+            'person': '',
+            'message': f'About {runner.estimated_matchable()} of {len(remaining)} people can be '
+                       f'offered an earlier appointment'
+        })
 
-        try:
-            # Process each person sequentially
-            for person in people_data:
-                if not appointments_data:
-                    yield json.dumps({
+        while True:
+            if runner.stop_requested.is_set():
+                dispatching = False
+
+            # Fill every free call slot before waiting on worker events
+            while dispatching and in_flight < max_in_flight:
+                if retrying:
+                    position = retrying.popleft()
+                elif next_row < len(plan):
+                    position = next_row
+                    next_row = runner.position = next_row + 1
+                elif deferred:
+                    break
+                else:
+                    dispatching = False
+                    break
+
+                person_row = plan[position]
+                person = people[person_row]
+
+                if person_row in skip_rows:
+                    continue
+
+                if not appointments_data.count(lab):
+                    runner.publish({
                         'type': 'complete',
                         'message': 'No more appointments available'
-                    }) + '\n'
+                    })
+                    dispatching = False
                     break
 
-                # Get person's current appointment date
                 current_apt_date = person.get('Extracted_Appointment_Date', '')
+                person_name = person.name
 
-                # Filter appointments to only include those BEFORE current appointment
-                filtered_appointments = []
-                if current_apt_date:
-                    try:
-                        current_date = pd.to_datetime(current_apt_date)
-                        for apt in appointments_data:
-                            apt_date_str = apt.get('date', '')
-                            try:
-                                apt_date = pd.to_datetime(apt_date_str)
-                                # Only include if appointment is BEFORE current appointment
-                                if apt_date < current_date:
-                                    filtered_appointments.append(apt)
-                            except:
-                                # If date parsing fails, skip this appointment
-                                continue
-                    except:
-                        # If current date parsing fails, use all appointments
-                        filtered_appointments = appointments_data[:5]
-                else:
-                    # If no current appointment date, use all appointments
-                    filtered_appointments = appointments_data[:5]
-
-                # Get top 5 earlier available appointments
-                available_apts = filtered_appointments[:5]
-
-                # Skip if no earlier appointments available
-                if not available_apts:
-                    person_name = f"{person.get('Patient-First', '')} {person.get('Patient-Last', '')}".strip()
-                    yield json.dumps({
+                # Numbers that failed validation at upload are never dialed
+                if not person.phone:
+                    runner.publish({
                         'type': 'info',
                         'person': person_name,
-                        'message': f'No earlier appointments available (current: {current_apt_date})'
-                    }) + '\n'
-
-                    # Log as skipped
-                    result = {
+                        'message': 'Skipped - missing or invalid phone number'
+                    })
+                    record_result(campaign_id, person_row, None, {
                         'Patient Name': person_name,
                         'Patient DOB': person.get('Date_of_Birth', ''),
                         'Call Successful': False,
@@ -445,92 +2976,37 @@ def start_calling():
                         'Appointment Confirmed': '',
                         'Appointment Rescheduled': False,
                         'New Appointment Date': '',
-                        'Call Summary': f'Skipped - No earlier appointments available (current: {current_apt_date})',
+                        'Call Summary': 'Skipped - missing or invalid phone number',
                         'Detailed Call Summary': '',
                         'To-do List': '',
                         'Asked for DNC': False,
                         'Recording URL': '',
-                        'Outcome': 'skipped_no_earlier_appointments'
-                    }
-                    call_results.append(result)
+                        'Outcome': 'skipped_invalid_phone'
+                    })
+                    runner.matcher.finish(person_row)
+                    checkpoint()
                     continue
 
-                # Send status update
-                person_name = f"{person.get('Patient-First', '')} {person.get('Patient-Last', '')}".strip()
-                current_status = f"Calling {person_name}"
+                # Get top 5 earlier available appointments, held for this call so the
+                # people dialed alongside it are offered different ones
+                available_apts = get_earlier_appointments(person, holder=(campaign_id, person_row), lab=lab,
+                                                          matcher=runner.matcher)
 
-                yield json.dumps({
-                    'type': 'calling',
-                    'person': person_name,
-                    'phone': person.get('phone number', person.get('Cell Phone', ''))
-                }) + '\n'
+                # Every earlier slot is on offer to a call in progress; try again once one ends,
+                # and keep dialing the people after this one meanwhile
+                if not available_apts and in_flight and earlier_slots_on_hold(person, lab):
+                    deferred.append(position)
+                    continue
 
-                try:
-                    # Create call
-                    call_response = create_phone_call(person, available_apts, from_num)
-                    call_id = call_response['call_id']
+                # Skip if no earlier appointments available
+                if not available_apts:
+                    runner.publish({
+                        'type': 'info',
+                        'person': person_name,
+                        'message': f'No earlier appointments available (current: {current_apt_date})'
+                    })
 
-                    yield json.dumps({
-                        'type': 'call_created',
-                        'call_id': call_id,
-                        'person': person_name
-                    }) + '\n'
-
-                    # Poll until call ends
-                    call_data = poll_call_until_ended(call_id)
-
-                    if not call_data:
-                        result = {
-                            'Patient Name': person_name,
-                            'Patient DOB': person.get('Date_of_Birth', ''),
-                            'Call Successful': False,
-                            'In Voicemail': False,
-                            'User Sentiment': '',
-                            'Appointment Confirmed': '',
-                            'Appointment Rescheduled': False,
-                            'New Appointment Date': '',
-                            'Call Summary': 'Call timed out',
-                            'Detailed Call Summary': '',
-                            'To-do List': '',
-                            'Asked for DNC': False,
-                            'Recording URL': '',
-                            'Outcome': 'timeout'
-                        }
-                    else:
-                        # Extract analysis
-                        analysis = extract_appointment_from_analysis(call_data)
-
-                        result = {
-                            'Patient Name': person_name,
-                            'Patient DOB': analysis['patient_dob'] or person.get('Date_of_Birth', ''),
-                            'Call Successful': analysis['call_successful'],
-                            'In Voicemail': analysis['in_voicemail'],
-                            'User Sentiment': analysis['user_sentiment'],
-                            'Appointment Confirmed': analysis['appointment_confirmed'],
-                            'Appointment Rescheduled': analysis['appointment_rescheduled'],
-                            'New Appointment Date': analysis['new_appointment_date'] or '',
-                            'Call Summary': analysis['call_summary'],
-                            'Detailed Call Summary': analysis['detailed_call_summary'],
-                            'To-do List': analysis['to_do_list'],
-                            'Asked for DNC': analysis['asked_for_dnc'],
-                            'Recording URL': call_data.get('recording_url', ''),
-                            'Outcome': 'rescheduled' if analysis['appointment_rescheduled'] else 'no_reschedule'
-                        }
-
-                        # Remove appointment if rescheduled
-                        if analysis['appointment_rescheduled'] and analysis['new_appointment_date']:
-                            removed = find_and_remove_appointment(analysis['new_appointment_date'])
-                            if removed:
-                                result['Appointment Slot Removed'] = True
-
-                    call_results.append(result)
-
-                    yield json.dumps({
-                        'type': 'call_complete',
-                        'result': result
-                    }) + '\n'
-
-                except Exception as e:
+                    # Log as skipped
                     result = {
                         'Patient Name': person_name,
                         'Patient DOB': person.get('Date_of_Birth', ''),
@@ -540,54 +3016,433 @@ def start_calling():
                         'Appointment Confirmed': '',
                         'Appointment Rescheduled': False,
                         'New Appointment Date': '',
-                        'Call Summary': f'Error: {str(e)}',
+                        'Call Summary': f'Skipped - No earlier appointments available (current: {current_apt_date})',
                         'Detailed Call Summary': '',
                         'To-do List': '',
                         'Asked for DNC': False,
                         'Recording URL': '',
-                        'Outcome': 'error'
+                        'Outcome': 'skipped_no_earlier_appointments'
                     }
-                    call_results.append(result)
+                    record_result(campaign_id, person_row, None, result)
+                    runner.matcher.finish(person_row)
+                    checkpoint()
+                    continue
 
-                    yield json.dumps({
-                        'type': 'error',
-                        'person': person_name,
-                        'error': str(e)
-                    }) + '\n'
+                # Queue the attempt before the checkpoint moves past this person
+                attempt_id = store.start_attempt(campaign_id, person_row)
+                executor.submit(dial, campaign_id, person_row, person, person_name,
+                                available_apts, from_num, events, attempt_id, lab_name=lab)
+                in_flight += 1
+                runner.matcher.finish(person_row)
+                checkpoint()
+                runner.status = f"{in_flight} call(s) in progress"
+
+            if in_flight == 0:
+                break
+
+            event = events.get()
+            if event is None:
+                in_flight -= 1
+                runner.status = f"{in_flight} call(s) in progress"
+                # The call's offered slots were released; deferred people get another try
+                if deferred:
+                    retrying = deque(sorted([*retrying, *deferred]))
+                    deferred.clear()
+                continue
+
+            runner.publish(event)
+
+        stopped = runner.stop_requested.is_set()
+        if runner.interrupted:
+            store.set_campaign_status(campaign_id, 'interrupted')
+        else:
+            store.set_campaign_status(campaign_id, 'stopped' if stopped else 'completed')
+        runner.publish({
+            'type': 'complete',
+            'message': 'Campaign stopped - calls in progress finished' if stopped else 'All calls completed',
+            'total_calls': store.count_results(campaign_id)
+        })
 
-            yield json.dumps({
-                'type': 'complete',
-                'message': 'All calls completed',
-                'total_calls': len(call_results)
-            }) + '\n'
+    finally:
+        executor.shutdown(wait=False)
 
-        finally:
-            is_calling = False
-            current_status = "Ready"
 
-    return Response(generate(from_number), mimetype='text/plain')
+def running_campaigns():
+    """Campaigns still dialing, oldest launch first"""
+    return [runner for runner in list(campaign_runners.values()) if runner.is_running()]
 
 
-@app.route('/get-call-result/<call_id>', methods=['GET'])
-def get_call_result(call_id):
-    """Get the result of a specific call (used when campaign is stopped mid-call)"""
-    global call_results
+def conflicting_campaign(lab_name):
+    """A running campaign that would dial the same people as a campaign for lab_name"""
+    for runner in running_campaigns():
+        if runner.overlaps(lab_name):
+            return runner
+    return None
+
+
+def campaign_conflict_error(runner):
+    if runner.lab_name is None:
+        return 'A campaign for all labs is already in progress'
+    return f'A campaign for {runner.lab_name} is already in progress'
+
+
+def launch_campaign(runner, prepare=None, **start_kwargs):
+    """Start runner alongside the running campaigns; returns the running campaign it conflicts with, if any
+
+    `prepare`, when given, runs once no conflict is found and before the runner starts,
+    with no other launch in between; it returns extra arguments for runner.start. Work
+    that changes the store belongs there, so a rejected launch leaves nothing behind.
+    """
+    global current_campaign_id
+
+    with campaign_runners_lock:
+        conflict = conflicting_campaign(runner.lab_name)
+        if conflict is not None:
+            return conflict
+        if prepare is not None:
+            start_kwargs.update(prepare())
+        current_campaign_id = runner.campaign_id
+        store.set_meta('current_campaign_id', runner.campaign_id)
+
+        campaign_runners[runner.campaign_id] = runner
+        campaign_runners.move_to_end(runner.campaign_id)
+        # Forget the oldest finished campaigns; running ones are always kept
+        for campaign_id, retained in list(campaign_runners.items()):
+            if len(campaign_runners) <= MAX_RETAINED_CAMPAIGNS:
+                break
+            if not retained.is_running() and retained is not runner:
+                del campaign_runners[campaign_id]
+
+        runner.start(**start_kwargs)
+        status_tracker.bump('is_calling', 'active_campaign_id', 'active_campaigns', 'current_status')
+        return None
+
+
+def is_long_request(path):
+    """Whether a request path may hold its connection open for a long time"""
+    return LONG_REQUEST_PATH.match(path) is not None
+
+
+def drain_campaigns(timeout):
+    """Stop every running campaign from dialing and give live calls up to `timeout` seconds to end
+
+    Returns True when nothing is left running. Campaigns that still have live calls are
+    marked interrupted; resuming them after a restart reattaches to those calls.
+    """
+    runners = running_campaigns()
+    for runner in runners:
+        runner.interrupt()
+
+    deadline = time.monotonic() + timeout
+    for runner in runners:
+        runner.finished.wait(max(0.0, deadline - time.monotonic()))
+
+    still_running = [runner for runner in runners if runner.is_running()]
+    for runner in still_running:
+        store.set_campaign_status(runner.campaign_id, 'interrupted')
+    store.checkpoint_wal()
+    return not still_running
+
+
+def campaign_started_response(runner):
+    """Tell the client where to follow a campaign it just started or resumed"""
+    return jsonify({
+        'success': True,
+        'campaign_id': runner.campaign_id,
+        'events_url': f'/campaigns/{runner.campaign_id}/events',
+        'stream_url': f'/campaigns/{runner.campaign_id}/stream'
+    }), 202
+
+
+def requested_profiler(data):
+    """The profiler to run a campaign under, from its "profile" option or CAMPAIGN_PROFILER
+
+    Returns (profiler name or None, error message or None).
+    """
+    flag = data.get('profile', request.args.get('profile'))
+    if flag is None or flag == '':
+        kind = CAMPAIGN_PROFILER or None
+    elif flag in (False, 0, '0', 'false', 'no'):
+        kind = None
+    elif flag in (True, 1, '1', 'true', 'yes'):
+        kind = CAMPAIGN_PROFILER or 'cprofile'
+    else:
+        kind = str(flag).lower()
+
+    if kind is None:
+        return None, None
+    if kind not in CAMPAIGN_PROFILERS:
+        return None, f"profile must be true or one of: {', '.join(CAMPAIGN_PROFILERS)}"
+    if kind == 'pyinstrument' and importlib.util.find_spec('pyinstrument') is None:
+        return None, 'Profiling with pyinstrument needs the pyinstrument package installed'
+    return kind, None
+
+
+def parse_since(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+@app.route('/start-calling', methods=['POST'])
+def start_calling():
+    """Start a concurrent calling campaign in the background"""
+    data = request.get_json() or {}
+    from_number = data.get('from_number')
+
+    if not from_number:
+        return jsonify({'error': 'No from_number provided. Please select a phone number.'}), 400
+
+    try:
+        max_concurrent_calls = int(data.get('max_concurrent_calls') or MAX_CONCURRENT_CALLS)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_concurrent_calls must be a whole number'}), 400
+
+    if max_concurrent_calls < 1:
+        return jsonify({'error': 'max_concurrent_calls must be at least 1'}), 400
+
+    ordering = data.get('ordering') or DEFAULT_CALL_ORDERING
+    if ordering not in CALL_ORDERINGS:
+        return jsonify({'error': f"ordering must be one of: {', '.join(CALL_ORDERINGS)}"}), 400
+
+    try:
+        weight = float(data.get('weight') or 1)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'weight must be a number'}), 400
+
+    if not weight > 0:
+        return jsonify({'error': 'weight must be greater than 0'}), 400
+
+    # Campaigns for different labs run side by side; without lab_name a campaign dials every lab
+    lab_name = lab_key(data.get('lab_name')) or None
+
+    profiler, error = requested_profiler(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    conflict = conflicting_campaign(lab_name)
+    if conflict is not None:
+        return jsonify({'error': campaign_conflict_error(conflict)}), 400
+
+    if not people_data:
+        return jsonify({'error': 'No people data loaded'}), 400
+
+    if lab_name is not None and lab_name not in people_data.labs:
+        return jsonify({'error': f'No people found for lab {lab_name}'}), 400
+
+    if not appointments_data.count(lab_name):
+        return jsonify({'error': 'No appointments data loaded' if not appointments_data
+                        else f'No open appointments for lab {lab_name}'}), 400
+
+    # Every run gets its own id so its results are stored and exported separately
+    campaign_id = uuid.uuid4().hex[:12]
+    store.create_campaign(campaign_id, from_number, max_concurrent_calls, people_version, ordering, lab_name,
+                          weight)
+
+    runner = CampaignRunner(campaign_id, from_number, max_concurrent_calls, ordering, lab_name, weight, profiler)
+    conflict = launch_campaign(runner)
+    if conflict is not None:
+        store.set_campaign_status(campaign_id, 'rejected')
+        return jsonify({'error': campaign_conflict_error(conflict)}), 400
+
+    return campaign_started_response(runner)
+
+
+@app.route('/campaigns/<campaign_id>/events', methods=['GET'])
+def campaign_events(campaign_id):
+    """Long-poll a campaign's events after the since=<seq> cursor"""
+    runner = campaign_runners.get(campaign_id)
+    if runner is None:
+        return jsonify({'error': 'No live events for this campaign'}), 404
+
+    since = parse_since(request.args.get('since'))
+    try:
+        timeout = min(max(float(request.args.get('timeout', 25)), 0), 55)
+    except ValueError:
+        return jsonify({'error': 'timeout must be a number of seconds'}), 400
+    events, truncated, finished = runner.bus.read(since, timeout=timeout)
+
+    return jsonify({
+        'campaign_id': campaign_id,
+        'events': events,
+        'last_seq': events[-1]['seq'] if events else since,
+        'truncated': truncated,
+        'finished': finished
+    })
+
+
+@app.route('/campaigns/<campaign_id>/stream', methods=['GET'])
+def campaign_stream(campaign_id):
+    """Server-sent events for a campaign; reconnects resume from Last-Event-ID"""
+    runner = campaign_runners.get(campaign_id)
+    if runner is None:
+        return jsonify({'error': 'No live events for this campaign'}), 404
+
+    since = parse_since(request.headers.get('Last-Event-ID') or request.args.get('since'))
+
+    def generate(cursor):
+        # Tell the browser how long to wait before reconnecting
+        yield 'retry: 2000\n\n'
+        while True:
+            events, truncated, finished = runner.bus.read(cursor, timeout=15)
+            if truncated:
+                yield 'event: truncated\ndata: {}\n\n'
+            for event in events:
+                cursor = event['seq']
+                yield f"id: {cursor}\ndata: {json.dumps(event)}\n\n"
+            if finished:
+                yield 'event: end\ndata: {}\n\n'
+                break
+            if not events:
+                # Heartbeat so proxies and the browser keep the connection open
+                yield ': keep-alive\n\n'
+
+    return Response(generate(since), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@app.route('/campaigns/<campaign_id>/stop', methods=['POST'])
+def stop_campaign(campaign_id):
+    """Stop dialing new people; calls in progress finish and are recorded"""
+    runner = campaign_runners.get(campaign_id)
+    if runner is None or not runner.is_running():
+        return jsonify({'error': 'Campaign is not running'}), 400
+
+    runner.stop()
+    return jsonify({'success': True, 'campaign_id': campaign_id})
+
+
+@app.route('/campaigns', methods=['GET'])
+def list_campaigns():
+    """List campaigns with their checkpoint and progress"""
+    return jsonify(store.list_campaigns())
+
+
+@app.route('/campaigns/<campaign_id>', methods=['GET'])
+def get_campaign(campaign_id):
+    """Get one campaign's checkpoint and progress"""
+    campaign = store.get_campaign(campaign_id)
+    if campaign is None:
+        return jsonify({'error': 'Campaign not found'}), 404
+
+    runner = campaign_runners.get(campaign_id)
+    if runner is not None and runner.is_running():
+        campaign['estimated_matchable'] = runner.estimated_matchable()
+    return jsonify(campaign)
+
+
+@app.route('/campaigns/<campaign_id>/resume', methods=['POST'])
+def resume_campaign(campaign_id):
+    """Resume an interrupted campaign: reattach to live calls and skip people with a final outcome"""
+    campaign = store.get_campaign(campaign_id)
+    if campaign is None:
+        return jsonify({'error': 'Campaign not found'}), 404
+
+    if campaign['status'] in ('running', 'completed'):
+        runner = campaign_runners.get(campaign_id)
+        if runner is not None and runner.is_running():
+            return campaign_started_response(runner)
+        if campaign['status'] == 'completed':
+            return jsonify({'error': 'Campaign already completed'}), 400
+
+    if campaign['people_version'] != people_version:
+        return jsonify({'error': 'The people list was replaced since this campaign started; it cannot be resumed'}), 400
+
+    profiler, error = requested_profiler(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({'error': error}), 400
+
+    runner = CampaignRunner(campaign_id, campaign['from_number'], campaign['max_concurrent_calls'],
+                            campaign['ordering'], campaign['lab_name'], campaign['weight'], profiler)
+
+    def prepare():
+        """Settle attempts left open by the interruption; runs only once the resume is accepted"""
+        reattach = []
+        requeue_rows = set()
+        for attempt_id, person_row, call_id, status in store.open_attempts(campaign_id):
+            if call_id:
+                reattach.append((attempt_id, person_row, call_id))
+                continue
+
+            if status == 'queued':
+                # Never dialed; close this attempt and dial the person again below
+                store.close_attempt(attempt_id, 'requeued')
+                requeue_rows.add(person_row)
+                continue
+
+            # Dialing had started but no call id was saved; the call may have gone out,
+            # so record it rather than risk dialing the patient twice
+            person = people_data[person_row] if person_row is not None and person_row < len(people_data) else {}
+            person_name = f"{person.get('Patient-First', '')} {person.get('Patient-Last', '')}".strip()
+            record_result(campaign_id, person_row, None, {
+                'Patient Name': person_name,
+                'Patient DOB': person.get('Date_of_Birth', ''),
+                'Call Successful': False,
+                'In Voicemail': False,
+                'User Sentiment': '',
+                'Appointment Confirmed': '',
+                'Appointment Rescheduled': False,
+                'New Appointment Date': '',
+                'Call Summary': 'Interrupted while dialing - not redialed to avoid a duplicate call',
+                'Detailed Call Summary': '',
+                'To-do List': '',
+                'Asked for DNC': False,
+                'Recording URL': '',
+                'Outcome': 'interrupted'
+            }, attempt_id)
+
+        # People with a result or a live call are never dialed again
+        skip_rows = store.finished_rows(campaign_id) | {row for _, row, _ in reattach}
+
+        # Restart from the earliest person in the dialing order that was queued but never dialed
+        start_row = campaign['next_row']
+        if requeue_rows:
+            plan = plan_call_order(people_data, campaign['ordering'], campaign['lab_name'])
+            start_row = min(start_row, *(plan.index(row) for row in requeue_rows))
+
+        store.set_campaign_status(campaign_id, 'running')
+        return {'start_row': start_row, 'skip_rows': skip_rows, 'reattach': reattach}
+
+    conflict = launch_campaign(runner, prepare)
+    if conflict is not None:
+        return jsonify({'error': campaign_conflict_error(conflict)}), 400
+
+    return campaign_started_response(runner)
+
+
+def wait_for_call_result(call_id):
+    """Wait for a call to end and record its result once (runs on a call-result worker)
+
+    Returns (HTTP status, body) for /get-call-result.
+    """
+    recorded = store.result_for_call(call_id)
+    if recorded is not None:
+        return 200, {'success': True, 'result': recorded, 'already_recorded': True}
 
     try:
         # Poll until call ends (with shorter timeout for manual stop)
         call_data = poll_call_until_ended(call_id, max_wait_seconds=120)
 
         if not call_data:
-            return jsonify({
+            return 404, {
                 'success': False,
                 'error': 'Call timed out or not found'
-            }), 404
+            }
+
+        # File the result under the campaign that placed the call, if it was one of ours
+        attempt = store.attempt_for_call(call_id)
+        campaign = store.get_campaign(attempt[1]) if attempt else None
+        attempt_id, campaign_id, person_row = attempt if campaign else (None, current_campaign_id or 'manual', None)
+        person_name = 'Unknown (stopped mid-campaign)'
+        if (campaign and person_row is not None and campaign['people_version'] == people_version
+                and person_row < len(people_data)):
+            person_name = people_data[person_row].name
 
         # Extract analysis
         analysis = extract_appointment_from_analysis(call_data)
 
         result = {
-            'Patient Name': 'Unknown (stopped mid-campaign)',
+            'Patient Name': person_name,
             'Patient DOB': analysis['patient_dob'] or '',
             'Call Successful': analysis['call_successful'],
             'In Voicemail': analysis['in_voicemail'],
@@ -603,100 +3458,389 @@ def get_call_result(call_id):
             'Outcome': 'rescheduled' if analysis['appointment_rescheduled'] else 'no_reschedule'
         }
 
-        # Add to results if not already there
-        call_results.append(result)
-
-        # Remove appointment if rescheduled
+        # Remove appointment if rescheduled (a slot this call already holds is kept, not claimed twice)
         if analysis['appointment_rescheduled'] and analysis['new_appointment_date']:
-            find_and_remove_appointment(analysis['new_appointment_date'])
-
-        return jsonify({
+            removed, claimed_by = find_and_remove_appointment(analysis['new_appointment_date'], call_id,
+                                                              campaign['lab_name'] if campaign else None)
+            if removed:
+                result['Appointment Slot Removed'] = True
+            elif claimed_by:
+                result['Slot Conflict'] = f'Slot already claimed by call {claimed_by}'
+                result['Outcome'] = 'rescheduled_conflict'
+
+        if record_result(campaign_id, person_row, call_id, result, attempt_id) is None:
+            # The campaign recorded this call while we waited; report what it stored
+            return 200, {'success': True, 'result': store.result_for_call(call_id), 'already_recorded': True}
+
+        return 200, {
             'success': True,
             'result': result
-        })
+        }
 
     except Exception as e:
-        return jsonify({
+        return 500, {
             'success': False,
             'error': str(e)
-        }), 500
+        }
+
+
+def call_result_future(call_id):
+    """The shared wait for a call's result, started on first request"""
+    with call_result_futures_lock:
+        future = call_result_futures.get(call_id)
+        # A wait that ended without a result (timed out, not found, failed) is retried
+        if future is None or (future.done() and future.result()[0] != 200):
+            future = call_result_executor.submit(wait_for_call_result, call_id)
+            call_result_futures[call_id] = future
+        call_result_futures.move_to_end(call_id)
+
+        # Forget the oldest finished lookups; waits still running are always kept
+        for retained_id, retained in list(call_result_futures.items()):
+            if len(call_result_futures) <= MAX_RETAINED_CALL_RESULTS:
+                break
+            if retained.done():
+                del call_result_futures[retained_id]
+        return future
+
+
+@app.route('/get-call-result/<call_id>', methods=['GET'])
+def get_call_result(call_id):
+    """Get the result of a specific call (used when campaign is stopped mid-call)
+
+    Answers 202 with a status_url to poll while the call is still going; every request
+    for the same call shares one waiter. ?wait=<seconds> (up to 25) holds the request
+    that long for the result first.
+    """
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), 25)
+    except ValueError:
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+
+    future = call_result_future(call_id)
+    try:
+        status_code, body = future.result(timeout=wait)
+    except FutureTimeoutError:
+        return jsonify({
+            'success': True,
+            'status': 'pending',
+            'call_id': call_id,
+            'status_url': f'/get-call-result/{call_id}'
+        }), 202
+
+    return jsonify(body), status_code
+
+
+@app.route('/retell-webhook', methods=['POST'])
+def retell_webhook():
+    """Receive call_ended / call_analyzed events from Retell AI"""
+    body = request.get_data()
+
+    if RETELL_WEBHOOK_VERIFY and not verify_retell_signature(body, request.headers.get('x-retell-signature')):
+        return jsonify({'error': 'Invalid signature'}), 401
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return jsonify({'error': 'Invalid JSON'}), 400
+
+    event = payload.get('event')
+    call_data = payload.get('call') or {}
+
+    if event in ['call_ended', 'call_analyzed']:
+        notify_call_event(event, call_data)
+
+    return '', 204
+
+
+def export_rows(results, columns):
+    """Group results into batches of rows holding just the chosen columns"""
+    batch = []
+    for result in results:
+        batch.append([result.get(column, '') for column in columns])
+        if len(batch) == EXPORT_BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def render_csv(rows):
+    """Format rows as CSV text"""
+    buffer = StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def render_result_segment(results):
+    """CSV for a result segment: every result column, no header"""
+    return render_csv([result.get(column, '') for column in RESULT_COLUMNS] for result in results)
+
+
+def stream_csv(campaign_id, columns, outcomes, since, until):
+    """CSV export, sent a batch at a time; full exports reuse the pre-rendered result segments"""
+    yield render_csv([columns])
+
+    segments = store.result_segments(campaign_id, since, until) if columns == RESULT_COLUMNS and not outcomes else []
+    cursor = since
+    for first_seq, last_seq in segments:
+        # Results before this segment that are not in any segment we can use
+        for batch in export_rows(store.iter_results(campaign_id, outcomes, cursor, first_seq - 1), columns):
+            yield render_csv(batch)
+        yield store.segment_csv(campaign_id, first_seq)
+        cursor = last_seq
+
+    # The tail not yet sealed into a segment
+    for batch in export_rows(store.iter_results(campaign_id, outcomes, cursor, until), columns):
+        yield render_csv(batch)
+
+
+def write_xlsx(results, columns, path):
+    """XLSX export through openpyxl's write-only mode, which keeps only the current row in memory"""
+    import openpyxl
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Call Results')
+    sheet.append(columns)
+
+    for batch in export_rows(results, columns):
+        for row in batch:
+            sheet.append([ILLEGAL_CHARACTERS_RE.sub('', value) if isinstance(value, str) else value
+                          for value in row])
+
+    workbook.save(path)
+
+
+def write_parquet(results, columns, path):
+    """Parquet export, one row group per batch (needs pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, pa.bool_() if column in RESULT_BOOLEAN_COLUMNS else pa.string())
+                        for column in columns])
+
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in export_rows(results, columns):
+            arrays = []
+            for position, column in enumerate(columns):
+                if column in RESULT_BOOLEAN_COLUMNS:
+                    values = [row[position] if isinstance(row[position], bool) else None for row in batch]
+                else:
+                    values = [None if row[position] is None else str(row[position]) for row in batch]
+                arrays.append(pa.array(values, type=schema.field(column).type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+def send_export_file(write, results, columns, suffix, mimetype, download_name):
+    """Write an export to a temp file, then stream it and delete it once sent"""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        write(results, columns, path)
+    except Exception:
+        os.remove(path)
+        raise
+
+    def stream():
+        try:
+            with open(path, 'rb') as f:
+                while chunk := f.read(64 * 1024):
+                    yield chunk
+        finally:
+            os.remove(path)
+
+    response = Response(stream(), mimetype=mimetype)
+    response.headers['Content-Length'] = str(os.path.getsize(path))
+    response.headers['Content-Disposition'] = f'attachment; filename={download_name}'
+    return response
 
 
 @app.route('/download-results', methods=['GET'])
 def download_results():
-    """Generate and download results Excel file"""
-    global call_results
-    
-    if not call_results:
+    """Download results as format=xlsx (default), csv or parquet
+
+    campaign_id=<id> picks the campaign (default: the one launched most recently);
+    columns=<a,b,...> picks and orders the columns; outcome=<a,b,...> keeps only those outcomes;
+    since=<seq> returns only results newer than an earlier export's X-Results-Seq.
+
+    Only CSV truly streams: rows go out in batches as they are read. XLSX and Parquet are
+    written in full to a temp file first, so a large export needs that much disk and the
+    download starts only once the file is complete.
+    """
+    campaign_id = request.args.get('campaign_id') or current_campaign_id
+    export_format = request.args.get('format', 'xlsx').lower()
+
+    columns = RESULT_COLUMNS
+    if request.args.get('columns'):
+        columns = [column.strip() for column in request.args['columns'].split(',') if column.strip()]
+        unknown = [column for column in columns if column not in RESULT_COLUMNS]
+        if unknown:
+            return jsonify({'error': f"Unknown columns: {', '.join(unknown)}", 'columns': RESULT_COLUMNS}), 400
+
+    outcomes = [outcome.strip() for outcome in request.args.get('outcome', '').split(',') if outcome.strip()]
+    since = parse_since(request.args.get('since'))
+
+    # Export up to the newest result now, so the X-Results-Seq header is the since= for next time
+    until = store.max_result_seq(campaign_id) if campaign_id else 0
+    if not until:
         return jsonify({'error': 'No results available'}), 400
-    
-    # Create DataFrame
-    df = pd.DataFrame(call_results)
-    
-    # Create Excel file in memory
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Call Results')
-    
-    output.seek(0)
-    
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=f'call_results_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-    )
+
+    results = store.iter_results(campaign_id, outcomes, since, until)
+    download_name = f'call_results_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+
+    if export_format == 'csv':
+        response = Response(stream_csv(campaign_id, columns, outcomes, since, until), mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename={download_name}.csv'
+    elif export_format == 'xlsx':
+        response = send_export_file(write_xlsx, results, columns, '.xlsx',
+                                    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                                    f'{download_name}.xlsx')
+    elif export_format == 'parquet':
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            return jsonify({'error': 'Parquet export needs the pyarrow package installed'}), 400
+        response = send_export_file(write_parquet, results, columns, '.parquet', 'application/vnd.apache.parquet',
+                                    f'{download_name}.parquet')
+    else:
+        return jsonify({'error': 'Unsupported format. Use xlsx, csv or parquet'}), 400
+
+    response.headers['X-Results-Seq'] = str(until)
+    return response
+
+
+def status_field(field):
+    """Compute one /status field"""
+    running = running_campaigns()
+
+    if field == 'is_calling':
+        return bool(running)
+    if field == 'active_campaign_id':
+        # The most recently started campaign still dialing
+        return running[-1].campaign_id if running else None
+    if field == 'active_campaigns':
+        return [dict(runner.to_dict(), results_count=store.count_results(runner.campaign_id)) for runner in running]
+    if field == 'current_status':
+        if len(running) > 1:
+            return f"{len(running)} campaigns running"
+        return running[0].status if running else "Ready"
+    if field == 'people_count':
+        return len(people_data)
+    if field == 'labs':
+        return people_data.lab_names()
+    if field == 'appointments_count':
+        return len(appointments_data)
+    if field == 'original_appointments_count':
+        return store.count_slots()
+    if field == 'rescheduled_count':
+        return store.count_claimed_slots()
+    if field == 'slot_conflicts_count':
+        return len(appointments_data.conflicts)
+    if field == 'people_schema':
+        return people_schema
+    if field == 'appointments_schema':
+        return appointments_schema
+    raise KeyError(field)
 
 
 @app.route('/status', methods=['GET'])
 def get_status():
-    """Get current system status"""
-    return jsonify({
-        'is_calling': is_calling,
-        'current_status': current_status,
-        'people_count': len(people_data),
-        'appointments_count': len(appointments_data),
-        'original_appointments_count': original_appointments_count,
-        'rescheduled_count': rescheduled_count,
-        'results_count': len(call_results),
-        'people_schema': people_schema,
-        'appointments_schema': appointments_schema
-    })
+    """Get current system status
+
+    Responses carry an ETag of the state version, so an unchanged poll gets a 304.
+    With ?since=<state_version> only the fields that changed after that version are
+    returned. Every response carries a rate_limiter summary (seconds a new call or poll
+    would wait for a token, live calls and the current concurrency limit), which is part
+    of the ETag; ?diagnostics=1 adds API latency and the per-campaign limiter details.
+    """
+    version = status_tracker.version
+    # Whole seconds, so a throttled but otherwise idle dashboard still gets 304s between steps
+    rate_limiter = {
+        'wait_seconds': round(create_call_bucket.wait_time() + poll_bucket.wait_time()),
+        'active_calls': call_gate.active,
+        'concurrency_limit': call_gate.limit
+    }
+    etag = f'"{version}-{rate_limiter["wait_seconds"]}-{rate_limiter["active_calls"]}-{rate_limiter["concurrency_limit"]}"'
+    diagnostics = request.args.get('diagnostics') in ['1', 'true']
 
+    if not diagnostics and etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = Response(status=304)
+        response.headers['ETag'] = etag
+        return response
 
-@app.route('/phone-numbers', methods=['GET'])
-def get_phone_numbers():
-    """Fetch available phone numbers from Retell AI"""
-    try:
-        headers = {
-            "Authorization": f"Bearer {RETELL_API_KEY}"
-        }
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            fields = status_tracker.changed_since(int(since))
+        except ValueError:
+            return jsonify({'error': 'since must be a state_version number'}), 400
+        status = {'state_version': version, 'delta': True, 'changed': {field: status_field(field) for field in fields}}
+    else:
+        status = {field: status_field(field) for field in STATUS_FIELDS}
+        status['state_version'] = version
+    status['rate_limiter'] = rate_limiter
+
+    if diagnostics:
+        status['api_latency'] = retell.latency_stats()
+        rate_limiter.update({
+            'create_call_wait_seconds': create_call_bucket.wait_time(),
+            'poll_wait_seconds': poll_bucket.wait_time(),
+            'active_calls_by_campaign': dict(call_gate.held),
+            'calls_per_minute': RETELL_CALLS_PER_MINUTE
+        })
 
-        response = requests.get(
-            "https://api.retellai.com/list-phone-numbers",
-            headers=headers
-        )
+    response = jsonify(status)
+    if not diagnostics:
+        response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
-        if response.status_code != 200:
-            return jsonify({'error': f'Failed to fetch phone numbers: {response.status_code}'}), response.status_code
 
-        phone_numbers = response.json()
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text-format metrics: Retell latency, slot filtering, polling, outcomes and queue depth"""
+    if not metrics.enabled:
+        return jsonify({'error': 'Metrics are disabled. Set METRICS_ENABLED=true in config.env'}), 404
 
-        # Format the response for the dropdown
-        formatted_numbers = []
-        for num in phone_numbers:
-            formatted_numbers.append({
-                'phone_number': num.get('phone_number', ''),
-                'phone_number_pretty': num.get('phone_number_pretty', num.get('phone_number', '')),
-                'nickname': num.get('nickname', ''),
-                'area_code': num.get('area_code', '')
-            })
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-        return jsonify(formatted_numbers)
 
+def cached_metadata_response(key):
+    """Serve a metadata cache entry, with X-Cache saying whether it was fresh, stale or just fetched"""
+    try:
+        value, cache_state = metadata_cache.get(key)
+    except RetellAPIError as e:
+        return jsonify({'error': str(e)}), e.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    response = jsonify(value)
+    response.headers['X-Cache'] = cache_state
+    return response
+
+
+@app.route('/phone-numbers', methods=['GET'])
+def get_phone_numbers():
+    """Available phone numbers from Retell AI (cached; see METADATA_CACHE_TTL)"""
+    return cached_metadata_response('phone_numbers')
+
+
+@app.route('/agent', methods=['GET'])
+def get_agent():
+    """The configured Retell agent's name, voice and language (cached; see METADATA_CACHE_TTL)"""
+    return cached_metadata_response('agent')
+
+
+@app.route('/metadata-cache/invalidate', methods=['POST'])
+def invalidate_metadata_cache():
+    """Drop cached phone numbers and agent details (or just ?key=phone_numbers|agent)"""
+    key = request.args.get('key')
+    if key is not None and key not in ('phone_numbers', 'agent'):
+        return jsonify({'error': 'key must be phone_numbers or agent'}), 400
+
+    metadata_cache.invalidate(key)
+    return jsonify({'success': True, 'invalidated': key or 'all'})
+
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=3000)
\ No newline at end of file
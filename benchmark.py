@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+AI Rescheduling Agent - Offline Benchmark
+Runs the app end to end against retell_simulator.py with synthetic data - no real phone calls
+
+    python benchmark.py --rows 10000 --duration 2 --concurrency 50 --output baseline.json
+    # ...change app.py...
+    python benchmark.py --rows 10000 --duration 2 --concurrency 50 --seed 1 --baseline baseline.json
+
+Reports calls per hour, p50/p99 latency per stage and the app's peak memory.
+"""
+
+import os
+import sys
+import csv
+import json
+import math
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from retell_simulator import RetellSimulator, add_simulator_arguments
+
+BASE_DIR = Path(__file__).parent
+
+# Runs the app the same way main.py does, minus config.env and the browser
+APP_BOOTSTRAP = """
+import sys
+sys.path.insert(0, {base_dir!r})
+import main
+from app import app
+if {serve!r} == 'production':
+    main.serve_production(app, {port})
+else:
+    main.serve_dev(app, {port})
+"""
+
+# (stage, histogram in /metrics, labels to match, unit)
+METRIC_STAGES = [
+    ('create_call', 'retell_request_seconds', {'endpoint': 'create-phone-call'}, 'ms'),
+    ('get_call', 'retell_request_seconds', {'endpoint': 'get-call'}, 'ms'),
+    ('line_wait', 'call_line_wait_seconds', {}, 'ms'),
+    ('slot_filter', 'slot_filter_seconds', {}, 'ms'),
+    ('slot_reserve', 'slot_reserve_seconds', {}, 'ms'),
+    ('analysis_wait', 'call_analysis_wait_seconds', {}, 'ms'),
+    ('polls_per_call', 'call_polls', {}, 'polls'),
+]
+
+PEOPLE_COLUMNS = [
+    'Patient-First', 'Patient-Last', 'Date_of_Birth', 'Cell Phone', 'Lab_Name', 'Lab_Phone', 'Test_Type',
+    'Extracted_Appointment_Date', 'Appointment_Day_Of_Week', 'Appointment_Month', 'Appointment_Day_Of_Month',
+    'Is_Tonight', 'Is_Tomorrow'
+]
+
+
+def random_time(rng, first_day, last_day):
+    """A weekday-hours appointment time between first_day and last_day days from now"""
+    day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(
+        days=rng.randint(first_day, last_day))
+    return day + timedelta(hours=rng.randint(8, 16), minutes=rng.choice((0, 15, 30, 45)))
+
+
+def make_people_csv(path, rows, labs, rng):
+    """Synthetic call list; current appointments are 45-90 days out so most people have earlier slots"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(PEOPLE_COLUMNS)
+        for n in range(rows):
+            appointment = random_time(rng, 45, 90)
+            birth = datetime(1940, 1, 1) + timedelta(days=rng.randint(0, 65 * 365))
+            writer.writerow([
+                f'Bench{n}', 'Patient', birth.strftime('%Y-%m-%d'),
+                f'(555) {n // 10000 % 1000:03d}-{n % 10000:04d}',
+                f'Bench Lab {n % labs + 1}', '+15550199999', 'Blood Panel',
+                appointment.strftime('%Y-%m-%d %H:%M'), appointment.strftime('%A'), appointment.strftime('%B'),
+                appointment.day, 'No', 'No'
+            ])
+
+
+def make_appointments_csv(path, slots, labs, rng):
+    """Synthetic open slots over the next 60 days"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['date', 'Lab_Name'])
+        for n in range(slots):
+            writer.writerow([random_time(rng, 1, 60).strftime('%Y-%m-%d %H:%M'), f'Bench Lab {n % labs + 1}'])
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    """Exact percentile (nearest rank) of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def parse_histograms(text):
+    """Bucket counts from Prometheus text: {name: {labels: {le: cumulative count}}}"""
+    histograms = {}
+    for line in text.splitlines():
+        if line.startswith('#') or '_bucket{' not in line:
+            continue
+        series, value = line.rsplit(' ', 1)
+        name, labels = series.split('{', 1)
+        pairs = dict(pair.split('=', 1) for pair in labels.rstrip('}').split(','))
+        pairs = {key: raw.strip('"') for key, raw in pairs.items()}
+        le = pairs.pop('le')
+        buckets = histograms.setdefault(name[:-len('_bucket')], {}).setdefault(tuple(sorted(pairs.items())), {})
+        buckets[float('inf') if le == '+Inf' else float(le)] = float(value)
+    return histograms
+
+
+def histogram_quantile(series, q, match, interpolate=True):
+    """Estimate a quantile across matching series by linear interpolation within buckets,
+    the way Prometheus' histogram_quantile does; without interpolation (for whole-number
+    counts) the bucket's upper bound is returned"""
+    totals = {}
+    for labels, buckets in series.items():
+        if all(dict(labels).get(key) == value for key, value in match.items()):
+            for bound, count in buckets.items():
+                totals[bound] = totals.get(bound, 0) + count
+
+    bounds = sorted(totals)
+    if not bounds or not totals[bounds[-1]]:
+        return None, 0
+
+    count = totals[bounds[-1]]
+    rank = q * count
+    lower, below = 0.0, 0.0
+    for bound in bounds:
+        if totals[bound] >= rank:
+            if bound == float('inf'):
+                return lower, int(count)
+            if not interpolate:
+                return bound, int(count)
+            share = (rank - below) / (totals[bound] - below) if totals[bound] > below else 1.0
+            return lower + (bound - lower) * share, int(count)
+        lower, below = bound, totals[bound]
+    return lower, int(count)
+
+
+def peak_rss_mb(pid):
+    """Peak resident memory of a running process (Linux), or None"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def children_peak_rss_mb():
+    """Peak resident memory of the largest exited child process, or None where unsupported"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def start_app(port, env, serve, log_path):
+    code = APP_BOOTSTRAP.format(base_dir=str(BASE_DIR), serve=serve, port=port)
+    log = open(log_path, 'w')
+    return subprocess.Popen([sys.executable, '-c', code], env=env, stdout=log, stderr=subprocess.STDOUT,
+                            cwd=str(BASE_DIR))
+
+
+def wait_for_app(session, base_url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('The app exited during startup')
+        try:
+            if session.get(f'{base_url}/status', timeout=2).status_code == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError('The app did not start in time')
+
+
+def upload(session, base_url, endpoint, path, timeout=1800):
+    """Upload a file and wait for its ingest job; returns seconds taken"""
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        response = session.post(f'{base_url}{endpoint}', files={'file': (os.path.basename(path), f, 'text/csv')})
+    if response.status_code != 202:
+        raise RuntimeError(f'{endpoint} failed: {response.status_code} {response.text}')
+
+    status_url = response.json()['status_url']
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = session.get(f'{base_url}{status_url}').json()
+        if job['status'] == 'done':
+            return time.perf_counter() - start
+        if job['status'] == 'failed':
+            raise RuntimeError(f"{endpoint} failed: {job['error']}")
+        time.sleep(0.05)
+    raise RuntimeError(f'{endpoint} did not finish in time')
+
+
+def run_campaign(session, base_url, from_number, concurrency, max_seconds, profile=None):
+    """Start a campaign and follow it to the end; returns (campaign, seconds, /status latencies)"""
+    start = time.perf_counter()
+    response = session.post(f'{base_url}/start-calling', json={
+        'from_number': from_number,
+        'max_concurrent_calls': concurrency,
+        'profile': profile or False
+    })
+    if response.status_code != 202:
+        raise RuntimeError(f'/start-calling failed: {response.status_code} {response.text}')
+    campaign_id = response.json()['campaign_id']
+
+    status_latencies = []
+    stop_sent = False
+    while True:
+        time.sleep(0.5)
+
+        # /status is what every open dashboard polls, so time it while calls run
+        polled = time.perf_counter()
+        session.get(f'{base_url}/status')
+        status_latencies.append(time.perf_counter() - polled)
+
+        campaign = session.get(f'{base_url}/campaigns/{campaign_id}').json()
+        if campaign['status'] != 'running':
+            return campaign, time.perf_counter() - start, status_latencies
+
+        if not stop_sent and time.perf_counter() - start > max_seconds:
+            print("   ⏱  Reached --max-minutes; stopping the campaign and waiting for calls in progress")
+            session.post(f'{base_url}/campaigns/{campaign_id}/stop')
+            stop_sent = True
+
+
+def find_profile(directory, campaign_id, timeout=60):
+    """Path of the campaign's saved profile; it is written just after the campaign finishes"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        matches = sorted(Path(directory).glob(f'campaign_{campaign_id}_*'))
+        if matches:
+            return str(matches[-1])
+        time.sleep(0.2)
+    return None
+
+
+def run_benchmark(args):
+    import requests
+
+    rng = random.Random(args.seed)
+    work_dir = Path(tempfile.mkdtemp(prefix='rescheduling-bench-'))
+    app_port = free_port()
+    base_url = f'http://127.0.0.1:{app_port}'
+
+    simulator = RetellSimulator.from_args(
+        args, webhook_url=None if args.no_webhooks else f'{base_url}/retell-webhook').start()
+    process = None
+
+    try:
+        slots = args.slots or args.rows
+        print(f"📝 Generating {args.rows:,} people and {slots:,} open slots...")
+        people_path = work_dir / 'people.csv'
+        appointments_path = work_dir / 'appointments.csv'
+        make_people_csv(people_path, args.rows, args.labs, rng)
+        make_appointments_csv(appointments_path, slots, args.labs, rng)
+
+        env = dict(os.environ)
+        env.update({
+            'RETELL_API_ROOT': simulator.url,
+            'RETELL_API_KEY': args.api_key,
+            'RETELL_AGENT_ID': 'sim-agent',
+            'CAMPAIGN_DB_PATH': str(work_dir / 'campaign_state.db'),
+            'METRICS_ENABLED': 'true',
+            'RETELL_CALLS_PER_MINUTE': str(args.calls_per_minute),
+            'RETELL_CONCURRENCY_LIMIT': str(args.concurrency),
+            'MAX_CALLS_PER_FROM_NUMBER': str(args.concurrency),
+            'RETELL_POLLS_PER_SECOND': str(args.polls_per_second),
+            'CAMPAIGN_PROFILE_DIR': str(Path(args.profile_dir).resolve()),
+            'PYTHONUNBUFFERED': '1'
+        })
+
+        print(f"🚀 Starting the app ({args.serve} server) against the simulator at {simulator.url}...")
+        session = requests.Session()
+        started = time.perf_counter()
+        process = start_app(app_port, env, args.serve, work_dir / 'app.log')
+        wait_for_app(session, base_url, process)
+        startup_seconds = time.perf_counter() - started
+
+        print("📤 Uploading...")
+        people_seconds = upload(session, base_url, '/upload-people', people_path)
+        appointments_seconds = upload(session, base_url, '/upload-appointments', appointments_path)
+
+        print(f"📞 Calling with up to {args.concurrency} calls at once...")
+        campaign, campaign_seconds, status_latencies = run_campaign(
+            session, base_url, simulator.phone_numbers[0], args.concurrency, args.max_minutes * 60, args.profile)
+        profile_path = find_profile(args.profile_dir, campaign['campaign_id']) if args.profile else None
+
+        metrics = session.get(f'{base_url}/metrics').text
+        peak_rss = peak_rss_mb(process.pid)
+    except Exception:
+        log_path = work_dir / 'app.log'
+        if log_path.exists():
+            print("❌ Benchmark failed. Last lines of the app's output:")
+            print(''.join(log_path.read_text().splitlines(keepends=True)[-20:]))
+        raise
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        simulator.stop()
+        if not args.keep_files:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if peak_rss is None:
+        peak_rss = children_peak_rss_mb()
+
+    sim_stats = simulator.stats()
+    hours = campaign_seconds / 3600
+    histograms = parse_histograms(metrics)
+
+    stages = {}
+    for stage, name, match, unit in METRIC_STAGES:
+        scale = 1000 if unit == 'ms' else 1
+        p50, count = histogram_quantile(histograms.get(name, {}), 0.5, match, interpolate=unit == 'ms')
+        p99, _ = histogram_quantile(histograms.get(name, {}), 0.99, match, interpolate=unit == 'ms')
+        stages[stage] = {
+            'unit': unit,
+            'count': count,
+            'p50': None if p50 is None else round(p50 * scale, 3),
+            'p99': None if p99 is None else round(p99 * scale, 3)
+        }
+    stages['status_request'] = {
+        'unit': 'ms',
+        'count': len(status_latencies),
+        'p50': round(percentile(status_latencies, 0.5) * 1000, 3) if status_latencies else None,
+        'p99': round(percentile(status_latencies, 0.99) * 1000, 3) if status_latencies else None
+    }
+
+    return {
+        'config': {
+            'rows': args.rows, 'slots': slots, 'labs': args.labs, 'concurrency': args.concurrency,
+            'serve': args.serve, 'webhooks': not args.no_webhooks, 'duration': args.duration,
+            'duration_dist': args.duration_dist, 'analysis_delay': args.analysis_delay,
+            'voicemail_rate': args.voicemail_rate, 'reschedule_rate': args.reschedule_rate,
+            'error_429_rate': args.error_429_rate, 'error_5xx_rate': args.error_5xx_rate, 'seed': args.seed,
+            'python': sys.version.split()[0], 'recorded_at': datetime.now().isoformat(timespec='seconds')
+        },
+        'campaign_status': campaign['status'],
+        'throughput': {
+            'calls_created': sim_stats['calls_created'],
+            'results': campaign['results_count'],
+            'campaign_seconds': round(campaign_seconds, 2),
+            'calls_per_hour': round(sim_stats['calls_created'] / hours, 1) if hours else None,
+            'results_per_hour': round(campaign['results_count'] / hours, 1) if hours else None
+        },
+        'startup_seconds': round(startup_seconds, 3),
+        'uploads': {
+            'people_seconds': round(people_seconds, 3),
+            'appointments_seconds': round(appointments_seconds, 3)
+        },
+        'stages': stages,
+        'peak_rss_mb': peak_rss,
+        'profile_path': profile_path,
+        'simulator': sim_stats
+    }
+
+
+def comparable_values(report):
+    """Flatten the numbers worth comparing between runs"""
+    values = {f'throughput.{key}': value for key, value in report['throughput'].items()}
+    values['startup_seconds'] = report['startup_seconds']
+    values.update({f'uploads.{key}': value for key, value in report['uploads'].items()})
+    for stage, stats in report['stages'].items():
+        values[f'{stage}.p50_{stats["unit"]}'] = stats['p50']
+        values[f'{stage}.p99_{stats["unit"]}'] = stats['p99']
+    values['peak_rss_mb'] = report['peak_rss_mb']
+    return values
+
+
+def print_report(report, baseline=None):
+    throughput = report['throughput']
+    print()
+    print("="*60)
+    print("  BENCHMARK RESULTS")
+    print("="*60)
+    print(f"   Campaign {report['campaign_status']}: {throughput['calls_created']:,} calls, "
+          f"{throughput['results']:,} results in {throughput['campaign_seconds']:.1f}s")
+    print(f"   Calls per hour:    {throughput['calls_per_hour'] or 0:12,.0f}")
+    print(f"   Results per hour:  {throughput['results_per_hour'] or 0:12,.0f}")
+    print(f"   Startup:           {report['startup_seconds']:12.3f} s")
+    print(f"   Upload people:     {report['uploads']['people_seconds']:12.3f} s")
+    print(f"   Upload slots:      {report['uploads']['appointments_seconds']:12.3f} s")
+    peak = report['peak_rss_mb']
+    print(f"   Peak RSS:          {peak:12.1f} MB" if peak is not None else "   Peak RSS:          unavailable")
+    print()
+    print(f"   {'stage':<16}{'p50':>12}{'p99':>12}{'count':>10}")
+    for stage, stats in report['stages'].items():
+        p50 = '-' if stats['p50'] is None else f"{stats['p50']:.3f}"
+        p99 = '-' if stats['p99'] is None else f"{stats['p99']:.3f}"
+        print(f"   {stage:<16}{p50:>12}{p99:>12}{stats['count']:>10,}  {stats['unit']}")
+    print("   (all stages but status_request are estimated from /metrics histogram buckets)")
+
+    sim = report['simulator']
+    print()
+    print(f"   Simulator: {sim['polls']:,} polls, {sim['webhooks_sent']:,} webhooks, "
+          f"{sim['injected_429'] + sim['concurrency_429']:,} 429s and {sim['injected_5xx']:,} 5xx returned")
+    if report.get('profile_path'):
+        print(f"   Campaign profile: {report['profile_path']}")
+
+    if baseline:
+        print()
+        print(f"   Compared with baseline recorded {baseline['config'].get('recorded_at', '?')}:")
+        differing = [key for key, value in report['config'].items()
+                     if key not in ('python', 'recorded_at') and baseline['config'].get(key) != value]
+        if differing:
+            print(f"   ⚠️  Settings differ from the baseline ({', '.join(differing)}); numbers may not be comparable")
+        current = comparable_values(report)
+        for key, before in comparable_values(baseline).items():
+            after = current.get(key)
+            if before is None or after is None:
+                continue
+            change = f"{(after - before) / before * 100:+.1f}%" if before else 'n/a'
+            print(f"   {key:<32}{before:>14,.3f}{after:>14,.3f}{change:>10}")
+    print("="*60)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Offline end-to-end benchmark against a simulated Retell API')
+    parser.add_argument('--rows', type=int, default=10000, help='people in the synthetic call list')
+    parser.add_argument('--slots', type=int, default=0, help='open appointment slots (default: same as --rows)')
+    parser.add_argument('--labs', type=int, default=1, help='labs the people and slots are spread across')
+    parser.add_argument('--concurrency', type=int, default=50, help='max concurrent calls for the campaign')
+    parser.add_argument('--calls-per-minute', type=float, default=6000,
+                        help='RETELL_CALLS_PER_MINUTE for the app under test')
+    parser.add_argument('--polls-per-second', type=float, default=200,
+                        help='RETELL_POLLS_PER_SECOND for the app under test')
+    parser.add_argument('--serve', choices=('dev', 'production'), default='production',
+                        help='which server the app runs under')
+    parser.add_argument('--no-webhooks', action='store_true',
+                        help="don't send webhooks, so call ends are only found by polling")
+    parser.add_argument('--max-minutes', type=float, default=30,
+                        help='stop the campaign after this long and report what finished')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    parser.add_argument('--baseline', help='compare against a JSON report from an earlier run')
+    parser.add_argument('--keep-files', action='store_true', help='keep the generated data, database and app log')
+    parser.add_argument('--profile', choices=('cprofile', 'pyinstrument'),
+                        help='profile the campaign run and save it to --profile-dir')
+    parser.add_argument('--profile-dir', default='campaign_profiles', help='where campaign profiles are saved')
+    add_simulator_arguments(parser)
+    parser.set_defaults(duration=2.0, ring_seconds=0.2, analysis_delay=0.5)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    report = run_benchmark(args)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
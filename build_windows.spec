@@ -31,6 +31,7 @@ a = Analysis(
         'dotenv',
         'jinja2',
         'werkzeug',
+        'waitress',
     ],
     hookspath=[],
     hooksconfig={},
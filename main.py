@@ -7,6 +7,11 @@ Runs fully local on localhost - HIPAA compliant
 import os
 import sys
 import time
+import argparse
+import builtins
+import importlib.util
+import signal
+import tempfile
 import threading
 import webbrowser
 import socket
@@ -26,25 +31,32 @@ else:
 TEMPLATE_DIR = BASE_DIR / 'templates'
 STATIC_DIR = BASE_DIR / 'static'
 
+def load_config_file(env_file, verbose=True):
+    """Copy KEY=value lines from a config file into the environment"""
+    with open(env_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                key = key.strip()
+                value = value.strip()
+                os.environ[key] = value
+                if not verbose:
+                    continue
+                # Debug: print loaded values (without showing full credentials)
+                if 'KEY' in key or 'ID' in key:
+                    print(f"   Loaded {key}: {value[:10]}...")
+                else:
+                    print(f"   Loaded {key}: {value}")
+
+
 def setup_environment():
     """Set up environment variables from config file if it exists - MUST RUN BEFORE IMPORTING APP"""
     env_file = APP_DIR / 'config.env'
     
     if env_file.exists():
         print(f"📝 Loading configuration from: {env_file}")
-        with open(env_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    os.environ[key] = value
-                    # Debug: print loaded values (without showing full credentials)
-                    if 'KEY' in key or 'ID' in key:
-                        print(f"   Loaded {key}: {value[:10]}...")
-                    else:
-                        print(f"   Loaded {key}: {value}")
+        load_config_file(env_file)
         print("✅ Configuration loaded")
         
         # Validate configuration
@@ -116,8 +128,212 @@ def open_browser(port, delay=1.5):
         print(f"Please manually open: {url}")
 
 
+class ImportTimer:
+    """Times every module imported while installed (self time, excluding its own imports)"""
+
+    def __init__(self):
+        self.self_seconds = {}
+        self._original_import = None
+        self._local = threading.local()
+
+    def install(self):
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def uninstall(self):
+        builtins.__import__ = self._original_import
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        try:
+            module_name = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__'))
+        except (ImportError, ValueError):
+            module_name = name
+        if module_name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        # Each thread keeps its own stack of time spent in nested imports
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.self_seconds[module_name] = self.self_seconds.get(module_name, 0.0) + elapsed - nested
+
+    def by_package(self):
+        """Seconds spent importing each top-level package, slowest first"""
+        totals = {}
+        for module_name, seconds in self.self_seconds.items():
+            package = module_name.split('.')[0]
+            totals[package] = totals.get(package, 0.0) + seconds
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def profile_startup(top=15):
+    """Time startup up to the first dashboard page and report the slowest imports, then exit
+
+    Runs against a throwaway empty database so it never touches campaign state, and
+    never calls Retell.
+    """
+    timer = ImportTimer()
+    timer.install()
+    start = time.perf_counter()
+
+    env_file = APP_DIR / 'config.env'
+    if env_file.exists():
+        load_config_file(env_file, verbose=False)
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+        os.environ['CAMPAIGN_DB_PATH'] = str(Path(temp_dir) / 'campaign_state.db')
+        os.environ['RETELL_API_ROOT'] = 'http://127.0.0.1:9'
+        sys.path.insert(0, str(BASE_DIR))
+
+        from app import app, metadata_cache
+        imported = time.perf_counter()
+
+        # Render from the empty cache, as a fresh start does, without the background
+        # refresh that would load requests and call Retell while the report is taken
+        metadata_cache.refresh = lambda key: None
+
+        app.template_folder = str(TEMPLATE_DIR)
+        app.static_folder = str(STATIC_DIR)
+        with app.test_client() as client:
+            status_code = client.get('/').status_code
+        rendered = time.perf_counter()
+
+        timer.uninstall()
+
+    print("="*60)
+    print("  STARTUP PROFILE")
+    print("="*60)
+    print(f"   Import app:         {(imported - start) * 1000:8.1f} ms")
+    print(f"   First page render:  {(rendered - imported) * 1000:8.1f} ms (HTTP {status_code})")
+    print(f"   Time to first page: {(rendered - start) * 1000:8.1f} ms")
+    print()
+    print(f"   Slowest imports (top {top} packages):")
+    for package, seconds in timer.by_package()[:top]:
+        print(f"   {seconds * 1000:8.1f} ms  {package}")
+    print()
+    # These should only load on first upload, export or Retell call
+    deferred = [name for name in ('pandas', 'openpyxl', 'requests', 'pyarrow') if name in sys.modules]
+    print(f"   Deferred modules loaded before first page: {', '.join(deferred) or 'none'}")
+    print("="*60)
+
+
+class RoutedTaskDispatcher:
+    """Waitress task dispatcher with separate thread pools for long-lived and short requests
+
+    Event streams, long polls and exports can hold a thread for minutes; giving them their
+    own pool means they can never use up the threads that /status and uploads need.
+    """
+
+    def __init__(self, short_threads, long_threads, is_long_request):
+        from waitress.task import ThreadedTaskDispatcher
+
+        self.short = ThreadedTaskDispatcher()
+        self.long = ThreadedTaskDispatcher()
+        self.short.set_thread_count(short_threads)
+        self.long.set_thread_count(long_threads)
+        self.is_long_request = is_long_request
+
+    def set_thread_count(self, count):
+        self.short.set_thread_count(count)
+
+    def add_task(self, channel):
+        # Waitress queues the channel, which serves channel.requests[0] next. channel.request
+        # is the request still being parsed, so it is wrong for a pipelined request that is
+        # re-queued after the one before it finishes. The caller holds channel.requests_lock.
+        # Checked against waitress 3.0.2 (pinned) by tests/test_task_routing.py
+        requests = getattr(channel, 'requests', None)
+        path = getattr(requests[0], 'path', None) if requests else None
+        (self.long if self.is_long_request(path or '') else self.short).add_task(channel)
+
+    def shutdown(self, cancel_pending=True, timeout=5):
+        long_done = self.long.shutdown(cancel_pending, timeout)
+        short_done = self.short.shutdown(cancel_pending, timeout)
+        return long_done and short_done
+
+
+def raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve_production(app, port):
+    """Serve with waitress, bounded thread pools, until Ctrl+C or a termination signal"""
+    from waitress.server import create_server
+    from app import is_long_request
+
+    short_threads = int(os.environ.get('SERVER_THREADS', '8'))
+    long_threads = int(os.environ.get('SERVER_STREAM_THREADS', '32'))
+    dispatcher = RoutedTaskDispatcher(short_threads, long_threads, is_long_request)
+    server = create_server(
+        app,
+        host='127.0.0.1',  # CRITICAL: localhost only
+        port=port,
+        threads=short_threads,
+        connection_limit=short_threads + long_threads + 50,
+        ident='AI Rescheduling Agent',
+        _dispatcher=dispatcher
+    )
+    print(f"   Worker threads: {short_threads} short requests, {long_threads} streams and long polls")
+    try:
+        # Returns after Ctrl+C, once both pools have been shut down
+        server.run()
+    finally:
+        server.close()
+
+
+def serve_dev(app, port):
+    """Serve with the Flask development server until Ctrl+C"""
+    # Run Flask - bind to localhost only for HIPAA compliance
+    app.run(
+        host='127.0.0.1',  # CRITICAL: localhost only
+        port=port,
+        debug=False,  # No debug in production
+        use_reloader=False,  # Don't reload (breaks PyInstaller)
+        threaded=True
+    )
+
+
+def shut_down_campaigns():
+    """Stop running campaigns from dialing and save their state so they can be resumed"""
+    from app import drain_campaigns
+
+    timeout = float(os.environ.get('SHUTDOWN_DRAIN_SECONDS', '15'))
+    print(f"⏳ Stopping campaigns (waiting up to {timeout:g}s for calls in progress)...")
+    if drain_campaigns(timeout):
+        print("✅ Campaign state saved")
+    else:
+        print("✅ Campaign state saved - calls still in progress will be picked up when you resume")
+
+    # Everything worth keeping is in the database now; threads still waiting on Retell
+    # (live calls, /get-call-result lookups) would otherwise keep the process alive
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='AI Rescheduling Agent')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='report how long startup takes up to the first page, and the slowest imports, then exit')
+    parser.add_argument('--serve', choices=['dev', 'production'],
+                        help='web server to run (default: SERVE_MODE from config.env, else dev)')
+    # PyInstaller on macOS may pass extra arguments (such as -psn_...) to the app
+    args, _ = parser.parse_known_args()
+    return args
+
+
 def main():
     """Main entry point for the standalone application"""
+    args = parse_args()
+    if args.profile_startup:
+        profile_startup()
+        return
+
     print("="*60)
     print("  AI Rescheduling Agent - Standalone Edition")
     print("  HIPAA Compliant - Runs Fully Local")
@@ -129,6 +345,9 @@ def main():
     setup_environment()
     print()
     
+    # Keep the campaign database next to the executable, not in the bundle's temp dir
+    os.environ.setdefault('CAMPAIGN_DB_PATH', str(APP_DIR / 'campaign_state.db'))
+
     # NOW import the Flask app (after environment is set)
     sys.path.insert(0, str(BASE_DIR))
     from app import app
@@ -149,6 +368,14 @@ def main():
     # Set Flask template and static folders
     app.template_folder = str(TEMPLATE_DIR)
     app.static_folder = str(STATIC_DIR)
+
+    serve_mode = args.serve or os.environ.get('SERVE_MODE', 'dev')
+    if serve_mode == 'production':
+        try:
+            import waitress  # noqa: F401
+        except ImportError:
+            print("⚠️  Production serving needs the waitress package; using the development server")
+            serve_mode = 'dev'
     
     # Start browser in separate thread
     browser_thread = threading.Thread(target=open_browser, args=(port,), daemon=True)
@@ -169,15 +396,17 @@ def main():
     print("="*60)
     print()
     
+    # Shut down the same way on Ctrl+C, a termination signal or Ctrl+Break on Windows
+    for name in ('SIGTERM', 'SIGBREAK'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), raise_keyboard_interrupt)
+
     try:
-        # Run Flask - bind to localhost only for HIPAA compliance
-        app.run(
-            host='127.0.0.1',  # CRITICAL: localhost only
-            port=port,
-            debug=False,  # No debug in production
-            use_reloader=False,  # Don't reload (breaks PyInstaller)
-            threaded=True
-        )
+        if serve_mode == 'production':
+            serve_production(app, port)
+        else:
+            serve_dev(app, port)
+        print("\n\n🛑 Server stopped by user")
     except KeyboardInterrupt:
         print("\n\n🛑 Server stopped by user")
     except Exception as e:
@@ -185,5 +414,7 @@ def main():
         input("\nPress Enter to exit...")
         sys.exit(1)
 
+    shut_down_campaigns()
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+AI Rescheduling Agent - Micro-benchmarks
+Times the functions whose cost grows with list size, at several sizes - no Retell calls
+
+    python microbench.py                                   # sizes 1000, 10000, 100000
+    python microbench.py --sizes 1000,50000 --only slot_filter,export_csv
+    python microbench.py --output micro.json               # save a baseline, then after a change:
+    python microbench.py --baseline micro.json --max-regression 25
+
+Each benchmark is set up fresh (untimed) for every round, then timed; the report shows
+the fastest and median round, time per operation, and how time per operation grows
+with size, which is where scaling regressions show up.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+from benchmark import make_appointments_csv, make_people_csv
+
+BASE_DIR = Path(__file__).parent
+WORK_DIR = Path(tempfile.mkdtemp(prefix='rescheduling-microbench-'))
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+
+# app.py reads its configuration at import time; keep it away from real data and Retell
+os.environ['CAMPAIGN_DB_PATH'] = str(WORK_DIR / 'campaign_state.db')
+os.environ.setdefault('RETELL_API_KEY', 'microbench')
+os.environ.setdefault('RETELL_AGENT_ID', 'microbench-agent')
+os.environ['RETELL_API_ROOT'] = 'http://127.0.0.1:9'
+sys.path.insert(0, str(BASE_DIR))
+
+import app  # noqa: E402
+
+# Operations per round for benchmarks that repeat a per-call step
+MAX_OPS = 1000
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """Register fn(size) -> (run, ops); fn does the untimed setup, run() is what gets timed"""
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+@lru_cache(maxsize=None)
+def people_frame(size):
+    import pandas as pd
+
+    path = WORK_DIR / f'people_{size}.csv'
+    make_people_csv(path, size, 1, random.Random(size))
+    return pd.read_csv(path)
+
+
+@lru_cache(maxsize=None)
+def slots_frame(size):
+    import pandas as pd
+
+    path = WORK_DIR / f'slots_{size}.csv'
+    make_appointments_csv(path, size, 1, random.Random(size + 1))
+    return pd.read_csv(path)
+
+
+@lru_cache(maxsize=None)
+def people_table(size):
+    table = app.PeopleTable()
+    table.append_frame(people_frame(size))
+    # Parse appointment times now, as a loaded list has by the time the dialer runs
+    table.appointment_ts
+    return table
+
+
+def simulated_call(rng):
+    """A finished call as Retell returns it, with analysis"""
+    rescheduled = rng.random() < 0.4
+    return {
+        'call_id': f'call_{rng.getrandbits(48):012x}',
+        'call_status': 'ended',
+        'recording_url': 'https://recordings.invalid/call.wav',
+        'call_analysis': {
+            'call_summary': 'The patient was offered earlier appointments. ' * 8,
+            'call_successful': True,
+            'in_voicemail': False,
+            'user_sentiment': 'Positive',
+            'custom_analysis_data': {
+                'Appointment Rescheduled': 'true' if rescheduled else 'false',
+                'New Appointment Date': '2026-11-02 09:30' if rescheduled else '',
+                'Appointment Confirmed': 'No' if rescheduled else 'Yes',
+                'Detailed Call Summary': 'Discussed available appointment times. ' * 20,
+                'Patient Full Name': '',
+                'Patient DOB': '',
+                'To-do List': '',
+                'Asked for DNC?': 'no'
+            }
+        }
+    }
+
+
+@benchmark('plan_call_order')
+def bench_plan_call_order(size):
+    """Ordering the call list, soonest current appointment first"""
+    people = people_table(size)
+    return lambda: app.plan_call_order(people, 'soonest_first'), 1
+
+
+@benchmark('slot_filter')
+def bench_slot_filter(size):
+    """Picking the five earlier slots offered to each person, among `size` open slots"""
+    app.appointments_data = app.SlotIndex.from_dataframe(slots_frame(size))[0]
+    people = people_table(MAX_OPS)
+    persons = [people[row] for row in range(len(people))]
+
+    def run():
+        for person in persons:
+            app.get_earlier_appointments(person)
+
+    return run, len(persons)
+
+
+@benchmark('slot_match')
+def bench_slot_match(size):
+    """Re-matching `size` people to `size` open slots, as a campaign does after each reservation"""
+    index = app.SlotIndex.from_dataframe(slots_frame(size))[0]
+    people = people_table(size)
+    matcher = app.SlotMatcher(people, range(len(people)))
+    matcher.refresh(index)
+    rounds = 10
+
+    def run():
+        for _ in range(rounds):
+            index.version += 1
+            matcher.refresh(index)
+
+    return run, rounds
+
+
+@benchmark('reserve_slot')
+def bench_reserve_slot(size):
+    """Reserving the slot a patient agreed to, among `size` open slots (includes the store write)"""
+    frame = slots_frame(size)
+    app.appointments_data = app.SlotIndex.from_dataframe(frame)[0]
+    rng = random.Random(size)
+    dates = rng.sample(list(frame['date']), min(size, MAX_OPS))
+
+    def run():
+        for n, date in enumerate(dates):
+            app.find_and_remove_appointment(date, f'microbench_{n}')
+
+    return run, len(dates)
+
+
+@benchmark('extract_analysis')
+def bench_extract_analysis(size):
+    """Reading the outcome out of `size` finished calls' analysis"""
+    rng = random.Random(size)
+    calls = [simulated_call(rng) for _ in range(size)]
+
+    def run():
+        for call in calls:
+            app.extract_appointment_from_analysis(call)
+
+    return run, len(calls)
+
+
+@benchmark('call_payload')
+def bench_call_payload(size):
+    """Building the create-phone-call body for people in a `size`-row list"""
+    people = people_table(size)
+    slots = app.SlotIndex.from_dataframe(slots_frame(MAX_OPS))[0]
+    offers = slots.first(5)
+    rows = range(0, size, max(1, size // MAX_OPS))
+
+    def run():
+        for row in rows:
+            app.build_call_payload(people[row], '+15550100001', offers)
+
+    return run, len(rows)
+
+
+@benchmark('infer_schema')
+def bench_infer_schema(size):
+    """Inferring the schema of a `size`-row upload"""
+    frame = people_frame(size)
+    return lambda: app.infer_schema_from_df(frame, 'microbench.csv'), 1
+
+
+@benchmark('validate_schema')
+def bench_validate_schema(size):
+    """Checking a `size`-row upload against the stored schema"""
+    frame = people_frame(size)
+    schema = app.infer_schema_from_df(frame, 'microbench.csv')
+    return lambda: app.validate_data_against_schema(frame, schema, 'People'), 1
+
+
+@lru_cache(maxsize=None)
+def results_campaign(size):
+    """A campaign with `size` stored results, segments sealed as they would be mid-campaign"""
+    campaign_id = f'microbench{size}'
+    rng = random.Random(size)
+    people = people_table(size)
+    rows = []
+    for row in range(size):
+        analysis = app.extract_appointment_from_analysis(simulated_call(rng))
+        result = {
+            'Patient Name': people[row].name,
+            'Patient DOB': people[row].get('Date_of_Birth', ''),
+            'Call Successful': analysis['call_successful'],
+            'In Voicemail': analysis['in_voicemail'],
+            'User Sentiment': analysis['user_sentiment'],
+            'Appointment Confirmed': analysis['appointment_confirmed'],
+            'Appointment Rescheduled': analysis['appointment_rescheduled'],
+            'New Appointment Date': analysis['new_appointment_date'] or '',
+            'Call Summary': analysis['call_summary'],
+            'Detailed Call Summary': analysis['detailed_call_summary'],
+            'To-do List': analysis['to_do_list'],
+            'Asked for DNC': analysis['asked_for_dnc'],
+            'Recording URL': 'https://recordings.invalid/call.wav',
+            'Outcome': 'rescheduled' if analysis['appointment_rescheduled'] else 'no_reschedule'
+        }
+        rows.append((campaign_id, row, f'{campaign_id}_{row}', result['Outcome'], app.store._dumps(result), time.time()))
+
+    app.store._write_many([(
+        'INSERT INTO results (campaign_id, person_row, call_id, outcome, data, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+        rows, True
+    )])
+    app.store.seal_result_segments(campaign_id, app.RESULT_SEGMENT_ROWS, app.render_result_segment)
+    return campaign_id
+
+
+def bench_download(export_format):
+    def bench(size):
+        url = f'/download-results?campaign_id={results_campaign(size)}&format={export_format}'
+        client = app.app.test_client()
+
+        def run():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} returned {response.status_code}')
+            response.get_data()
+            response.close()
+
+        return run, 1
+    bench.__doc__ = f'Downloading `size` results as {export_format}'
+    return bench
+
+
+benchmark('export_csv')(bench_download('csv'))
+benchmark('export_xlsx')(bench_download('xlsx'))
+
+
+def time_benchmark(factory, size, rounds):
+    timings = []
+    for _ in range(rounds):
+        run, ops = factory(size)
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {
+        'ops': ops,
+        'min_ms': round(best * 1000, 3),
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'per_op_us': round(best * 1e6 / ops, 3)
+    }
+
+
+def print_report(report, baseline=None, max_regression=None):
+    """Print the results table; returns the benchmarks that regressed past max_regression"""
+    regressions = []
+    base_results = baseline['results'] if baseline else {}
+
+    print()
+    print("="*81)
+    print("  MICRO-BENCHMARKS")
+    print("="*81)
+    header = f"   {'benchmark':<18}{'size':>9}{'ops':>7}{'min ms':>12}{'median ms':>12}{'per op µs':>15}{'growth':>8}"
+    if baseline:
+        header += f"{'vs base':>10}"
+    print(header)
+
+    for name, by_size in report['results'].items():
+        smallest = None
+        for size, stats in by_size.items():
+            # How much more each operation costs than at the smallest size
+            if smallest is None:
+                smallest = stats['per_op_us']
+            growth = f"{stats['per_op_us'] / smallest:.1f}x" if smallest else '-'
+            line = (f"   {name:<18}{int(size):>9,}{stats['ops']:>7,}{stats['min_ms']:>12,.3f}"
+                    f"{stats['median_ms']:>12,.3f}{stats['per_op_us']:>15,.3f}{growth:>8}")
+
+            before = base_results.get(name, {}).get(size)
+            if before and before['min_ms']:
+                change = (stats['min_ms'] - before['min_ms']) / before['min_ms'] * 100
+                line += f"{change:>+9.1f}%"
+                if max_regression is not None and change > max_regression:
+                    line += "  ⚠️"
+                    regressions.append(f'{name}@{size}')
+            print(line)
+
+    print("="*81)
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for code paths that grow with data size')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma-separated input sizes')
+    parser.add_argument('--only', help=f"comma-separated benchmarks to run: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--rounds', type=int, default=3, help='timed rounds per benchmark and size')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against a JSON file from an earlier run')
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help='exit with an error if any benchmark is this many percent slower than the baseline')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    names = [name.strip() for name in args.only.split(',')] if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit(f"Unknown benchmarks: {', '.join(unknown)}. Choose from: {', '.join(BENCHMARKS)}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    report = {
+        'config': {'sizes': sizes, 'rounds': args.rounds, 'python': sys.version.split()[0],
+                   'recorded_at': datetime.now().isoformat(timespec='seconds')},
+        'results': OrderedDict()
+    }
+    for name in names:
+        for size in sizes:
+            print(f"⏱  {name} at {size:,}...")
+            report['results'].setdefault(name, OrderedDict())[str(size)] = time_benchmark(
+                BENCHMARKS[name], size, args.rounds)
+
+    regressions = print_report(report, baseline, args.max_regression)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+    if regressions:
+        sys.exit(f"❌ Slower than the baseline by more than {args.max_regression:g}%: {', '.join(regressions)}")
+
+
+if __name__ == '__main__':
+    main()
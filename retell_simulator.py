@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Retell AI API Simulator - for offline benchmarks and testing
+Serves the Retell endpoints the app uses on localhost; no real phone calls are made
+
+Run it on its own and point the app at it:
+    python retell_simulator.py --port 8765
+    RETELL_API_ROOT=http://127.0.0.1:8765 RETELL_API_KEY=sim-key python main.py
+
+or start it from Python (see benchmark.py) with RetellSimulator(...).start().
+"""
+
+import time
+import json
+import hmac
+import math
+import heapq
+import random
+import hashlib
+import argparse
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DURATION_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+
+
+class SimulatedCall:
+    """One simulated call; its status is worked out from the clock whenever it is read"""
+
+    def __init__(self, call_id, from_number, to_number, agent_id, created_at, ring_seconds, duration,
+                 analysis_delay, in_voicemail, new_appointment_date):
+        self.call_id = call_id
+        self.from_number = from_number
+        self.to_number = to_number
+        self.agent_id = agent_id
+        self.created_at = created_at
+        self.started_at = created_at + ring_seconds
+        self.ended_at = self.started_at + duration
+        self.analyzed_at = self.ended_at + analysis_delay
+        self.in_voicemail = in_voicemail
+        self.new_appointment_date = new_appointment_date
+
+    def status(self, now):
+        if now < self.started_at:
+            return 'registered'
+        if now < self.ended_at:
+            return 'ongoing'
+        return 'ended'
+
+    def to_dict(self, now, epoch_offset):
+        """The call as GET /v2/get-call returns it at monotonic time `now`"""
+        status = self.status(now)
+        call = {
+            'call_id': self.call_id,
+            'agent_id': self.agent_id,
+            'call_type': 'phone_call',
+            'from_number': self.from_number,
+            'to_number': self.to_number,
+            'call_status': status
+        }
+        if status != 'registered':
+            call['start_timestamp'] = int((self.started_at + epoch_offset) * 1000)
+        if status == 'ended':
+            call['end_timestamp'] = int((self.ended_at + epoch_offset) * 1000)
+            call['disconnection_reason'] = 'voicemail_reached' if self.in_voicemail else 'user_hangup'
+            call['recording_url'] = f'https://recordings.invalid/{self.call_id}.wav'
+        if now >= self.analyzed_at:
+            call['call_analysis'] = self.analysis()
+        return call
+
+    def analysis(self):
+        rescheduled = bool(self.new_appointment_date)
+        if self.in_voicemail:
+            summary = 'Simulated call reached voicemail'
+        elif rescheduled:
+            summary = f'Simulated call - patient moved to {self.new_appointment_date}'
+        else:
+            summary = 'Simulated call - patient kept their appointment'
+        return {
+            'call_summary': summary,
+            'call_successful': not self.in_voicemail,
+            'in_voicemail': self.in_voicemail,
+            'user_sentiment': 'Neutral' if self.in_voicemail else 'Positive',
+            'custom_analysis_data': {
+                'Appointment Rescheduled': rescheduled,
+                'New Appointment Date': self.new_appointment_date or '',
+                'Appointment Confirmed': 'No' if rescheduled or self.in_voicemail else 'Yes',
+                'Detailed Call Summary': summary,
+                'Patient Full Name': '',
+                'Patient DOB': '',
+                'To-do List': '',
+                'Asked for DNC?': False
+            }
+        }
+
+
+class RetellSimulator:
+    """Local stand-in for the Retell API: create-phone-call, get-call, list-phone-numbers and get-agent
+
+    Call durations, voicemail and reschedule rates, analysis delay and injected 429/5xx
+    errors are configurable. With webhook_url set, call_ended and call_analyzed webhooks
+    are posted (signed with api_key) the way Retell sends them.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, api_key='sim-key', phone_numbers=1,
+                 duration=30.0, duration_dist='lognormal', duration_spread=0.5, ring_seconds=2.0,
+                 analysis_delay=3.0, voicemail_rate=0.3, reschedule_rate=0.4, error_429_rate=0.0,
+                 error_5xx_rate=0.0, retry_after=0, concurrency_limit=0, webhook_url=None, seed=None):
+        if duration_dist not in DURATION_DISTRIBUTIONS:
+            raise ValueError(f"duration_dist must be one of: {', '.join(DURATION_DISTRIBUTIONS)}")
+
+        self.host = host
+        self.port = port
+        self.api_key = api_key
+        self.phone_numbers = [f'+1555010{n:04d}' for n in range(1, phone_numbers + 1)]
+        self.duration = duration
+        self.duration_dist = duration_dist
+        self.duration_spread = duration_spread
+        self.ring_seconds = ring_seconds
+        self.analysis_delay = analysis_delay
+        self.voicemail_rate = voicemail_rate
+        self.reschedule_rate = reschedule_rate
+        self.error_429_rate = error_429_rate
+        self.error_5xx_rate = error_5xx_rate
+        self.retry_after = retry_after
+        self.concurrency_limit = concurrency_limit
+        self.webhook_url = webhook_url
+        self.random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+        # Monotonic clock for call timing, shifted to wall-clock time for timestamps
+        self.epoch_offset = time.time() - time.monotonic()
+        self.calls = {}
+        # End times of calls not yet over, soonest first
+        self._live_ends = []
+        self._calls_lock = threading.Lock()
+        self._next_call = 0
+        self._stats = {
+            'calls_created': 0, 'calls_voicemail': 0, 'calls_rescheduled': 0, 'polls': 0,
+            'injected_429': 0, 'injected_5xx': 0, 'concurrency_429': 0, 'webhooks_sent': 0, 'webhooks_failed': 0
+        }
+        self._stats_lock = threading.Lock()
+
+        # (due time, sequence, call_id, event) for webhooks still to send
+        self._webhooks = []
+        self._webhooks_cond = threading.Condition()
+        self._webhook_sequence = 0
+        self._webhook_senders = None
+        self._stopping = False
+        self.server = None
+
+    @classmethod
+    def from_args(cls, args, **overrides):
+        """Build a simulator from options added by add_simulator_arguments"""
+        options = {
+            'api_key': args.api_key, 'phone_numbers': args.phone_numbers, 'duration': args.duration,
+            'duration_dist': args.duration_dist, 'duration_spread': args.duration_spread,
+            'ring_seconds': args.ring_seconds, 'analysis_delay': args.analysis_delay,
+            'voicemail_rate': args.voicemail_rate, 'reschedule_rate': args.reschedule_rate,
+            'error_429_rate': args.error_429_rate, 'error_5xx_rate': args.error_5xx_rate,
+            'retry_after': args.retry_after, 'concurrency_limit': args.sim_concurrency_limit, 'seed': args.seed
+        }
+        options.update(overrides)
+        return cls(**options)
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def start(self):
+        """Serve on a background thread; returns once the port is bound"""
+        self.server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name='retell-simulator', daemon=True).start()
+
+        if self.webhook_url:
+            self._webhook_senders = ThreadPoolExecutor(max_workers=4, thread_name_prefix='sim-webhook')
+            threading.Thread(target=self._dispatch_webhooks, name='sim-webhooks', daemon=True).start()
+        return self
+
+    def stop(self):
+        with self._webhooks_cond:
+            self._stopping = True
+            self._webhooks_cond.notify_all()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self._webhook_senders is not None:
+            self._webhook_senders.shutdown(wait=False)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        with self._calls_lock:
+            stats['calls_live'] = self._live_calls(time.monotonic())
+        return stats
+
+    def _live_calls(self, now):
+        while self._live_ends and self._live_ends[0] <= now:
+            heapq.heappop(self._live_ends)
+        return len(self._live_ends)
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def sample_duration(self):
+        """Seconds a call lasts once answered, drawn from the configured distribution"""
+        mean = self.duration
+        spread = self.duration_spread
+        with self._random_lock:
+            if self.duration_dist == 'fixed' or mean <= 0:
+                return max(0.0, mean)
+            if self.duration_dist == 'uniform':
+                return self.random.uniform(mean * max(0.0, 1 - spread), mean * (1 + spread))
+            if self.duration_dist == 'exponential':
+                return self.random.expovariate(1 / mean)
+            # Lognormal with the requested mean; spread is sigma of the underlying normal
+            mu = math.log(mean) - spread ** 2 / 2
+            return self.random.lognormvariate(mu, spread)
+
+    def _chance(self, rate):
+        if rate <= 0:
+            return False
+        with self._random_lock:
+            return self.random.random() < rate
+
+    def _choose(self, options):
+        with self._random_lock:
+            return self.random.choice(options)
+
+    def injected_error(self):
+        """An (HTTP status, body) to fail this request with, or None"""
+        if self._chance(self.error_429_rate):
+            self._count('injected_429')
+            return 429, {'error_message': 'Simulated rate limit'}
+        if self._chance(self.error_5xx_rate):
+            self._count('injected_5xx')
+            return 503, {'error_message': 'Simulated server error'}
+        return None
+
+    def create_call(self, payload):
+        from_number = payload.get('from_number')
+        to_number = payload.get('to_number')
+        if not from_number or not to_number:
+            return 400, {'error_message': 'from_number and to_number are required'}
+
+        now = time.monotonic()
+        in_voicemail = self._chance(self.voicemail_rate)
+        new_date = None
+        if not in_voicemail and self._chance(self.reschedule_rate):
+            # The patient takes one of the slots the agent offered
+            offers = (payload.get('retell_llm_dynamic_variables') or {}).get('Next_Open_Appointments') or '[]'
+            try:
+                slots = [slot for slot in json.loads(offers) if slot.get('date')]
+            except (TypeError, ValueError, AttributeError):
+                slots = []
+            if slots:
+                new_date = self._choose(slots)['date']
+
+        with self._calls_lock:
+            if self.concurrency_limit and self._live_calls(now) >= self.concurrency_limit:
+                self._count('concurrency_429')
+                return 429, {'error_message': 'Concurrency limit reached'}
+
+            self._next_call += 1
+            call_id = f'sim_{self._next_call:08d}'
+            call = SimulatedCall(call_id, from_number, to_number, payload.get('override_agent_id') or 'sim-agent',
+                                 now, self.ring_seconds, self.sample_duration(), self.analysis_delay,
+                                 in_voicemail, new_date)
+            self.calls[call_id] = call
+            heapq.heappush(self._live_ends, call.ended_at)
+
+        self._count('calls_created')
+        if in_voicemail:
+            self._count('calls_voicemail')
+        if new_date:
+            self._count('calls_rescheduled')
+
+        if self.webhook_url:
+            self._schedule_webhook(call.ended_at, call_id, 'call_ended')
+            self._schedule_webhook(call.analyzed_at, call_id, 'call_analyzed')
+
+        return 201, call.to_dict(now, self.epoch_offset)
+
+    def get_call(self, call_id):
+        self._count('polls')
+        with self._calls_lock:
+            call = self.calls.get(call_id)
+        if call is None:
+            return 404, {'error_message': 'Call not found'}
+        return 200, call.to_dict(time.monotonic(), self.epoch_offset)
+
+    def list_phone_numbers(self):
+        return 200, [{
+            'phone_number': number,
+            'phone_number_pretty': f'+1 ({number[2:5]}) {number[5:8]}-{number[8:]}',
+            'nickname': f'Simulator line {n}',
+            'area_code': int(number[2:5])
+        } for n, number in enumerate(self.phone_numbers, 1)]
+
+    def get_agent(self, agent_id):
+        return 200, {'agent_id': agent_id, 'agent_name': 'Simulated Agent', 'voice_id': 'sim-voice',
+                     'language': 'en-US'}
+
+    def _schedule_webhook(self, due, call_id, event):
+        with self._webhooks_cond:
+            self._webhook_sequence += 1
+            heapq.heappush(self._webhooks, (due, self._webhook_sequence, call_id, event))
+            self._webhooks_cond.notify()
+
+    def _dispatch_webhooks(self):
+        while True:
+            with self._webhooks_cond:
+                while not self._stopping and (not self._webhooks or self._webhooks[0][0] > time.monotonic()):
+                    timeout = self._webhooks[0][0] - time.monotonic() if self._webhooks else None
+                    self._webhooks_cond.wait(timeout)
+                if self._stopping:
+                    return
+                _, _, call_id, event = heapq.heappop(self._webhooks)
+            self._webhook_senders.submit(self._send_webhook, call_id, event)
+
+    def _send_webhook(self, call_id, event):
+        with self._calls_lock:
+            call = self.calls[call_id]
+        body = json.dumps({'event': event, 'call': call.to_dict(time.monotonic(), self.epoch_offset)}).encode()
+        timestamp = str(int(time.time() * 1000))
+        digest = hmac.new(self.api_key.encode(), body + timestamp.encode(), hashlib.sha256).hexdigest()
+        webhook = urllib.request.Request(self.webhook_url, data=body, method='POST', headers={
+            'Content-Type': 'application/json',
+            'x-retell-signature': f'v={timestamp},d={digest}'
+        })
+        try:
+            urllib.request.urlopen(webhook, timeout=10).close()
+            self._count('webhooks_sent')
+        except OSError:
+            self._count('webhooks_failed')
+
+    def route(self, method, path, headers, body):
+        """Handle one request, returning (HTTP status, JSON-able body, extra headers)"""
+        if headers.get('Authorization') != f'Bearer {self.api_key}':
+            return 401, {'error_message': 'Invalid API key'}, {}
+
+        error = self.injected_error()
+        if error is not None:
+            status, payload = error
+            extra = {'Retry-After': f'{self.retry_after:g}'} if status == 429 and self.retry_after else {}
+            return status, payload, extra
+
+        if method == 'POST' and path == '/v2/create-phone-call':
+            try:
+                payload = json.loads(body or b'{}')
+            except ValueError:
+                return 400, {'error_message': 'Invalid JSON'}, {}
+            return (*self.create_call(payload), {})
+        if method == 'GET' and path.startswith('/v2/get-call/'):
+            return (*self.get_call(path[len('/v2/get-call/'):]), {})
+        if method == 'GET' and path == '/list-phone-numbers':
+            return (*self.list_phone_numbers(), {})
+        if method == 'GET' and path.startswith('/get-agent/'):
+            return (*self.get_agent(path[len('/get-agent/'):]), {})
+        if method == 'GET' and path == '/_simulator/stats':
+            return 200, self.stats(), {}
+        return 404, {'error_message': f'Not simulated: {method} {path}'}, {}
+
+    def _handler_class(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real API, so the app's connection pool gets reused
+            protocol_version = 'HTTP/1.1'
+
+            def _handle(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, payload, extra = simulator.route(method, self.path.split('?', 1)[0], self.headers, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in extra.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def add_simulator_arguments(parser):
+    """Options shared by this script and benchmark.py"""
+    group = parser.add_argument_group('simulated Retell API')
+    group.add_argument('--api-key', default='sim-key', help='API key the simulator accepts and signs webhooks with')
+    group.add_argument('--phone-numbers', type=int, default=1, help='caller IDs returned by list-phone-numbers')
+    group.add_argument('--duration', type=float, default=30.0, help='mean seconds a call lasts once answered')
+    group.add_argument('--duration-dist', choices=DURATION_DISTRIBUTIONS, default='lognormal',
+                       help='distribution of call durations')
+    group.add_argument('--duration-spread', type=float, default=0.5,
+                       help='lognormal sigma, or +/- fraction of the mean for uniform')
+    group.add_argument('--ring-seconds', type=float, default=2.0, help='seconds from creation until answered')
+    group.add_argument('--analysis-delay', type=float, default=3.0,
+                       help='seconds after a call ends until its analysis is available')
+    group.add_argument('--voicemail-rate', type=float, default=0.3, help='fraction of calls that reach voicemail')
+    group.add_argument('--reschedule-rate', type=float, default=0.4,
+                       help='fraction of answered calls that take an offered slot')
+    group.add_argument('--error-429-rate', type=float, default=0.0, help='fraction of requests answered with 429')
+    group.add_argument('--error-5xx-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    group.add_argument('--retry-after', type=float, default=0, help='Retry-After seconds sent with injected 429s')
+    group.add_argument('--sim-concurrency-limit', type=int, default=0,
+                       help='live calls allowed before create-phone-call returns 429 (0 = unlimited)')
+    group.add_argument('--seed', type=int, default=None, help='random seed, for repeatable runs')
+    return parser
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Retell AI API simulator (no real calls)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--webhook-url', default=None,
+                        help="the app's /retell-webhook URL, to send call_ended and call_analyzed webhooks")
+    add_simulator_arguments(parser)
+    args = parser.parse_args()
+
+    simulator = RetellSimulator.from_args(args, host=args.host, port=args.port, webhook_url=args.webhook_url)
+    simulator.start()
+
+    print("="*60)
+    print("  RETELL API SIMULATOR")
+    print("="*60)
+    print(f"   Listening on {simulator.url}")
+    print("   Point the app at it with:")
+    print(f"   RETELL_API_ROOT={simulator.url} RETELL_API_KEY={args.api_key}")
+    print(f"   Caller IDs: {', '.join(simulator.phone_numbers)}")
+    print("="*60)
+
+    try:
+        while True:
+            time.sleep(10)
+            stats = simulator.stats()
+            print(f"   {stats['calls_created']} calls created, {stats['calls_live']} live, {stats['polls']} polls")
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""Regression checks for normalize_phone_numbers (run with: python -m pytest tests)"""
+
+import os
+import sys
+import tempfile
+
+# app.py opens its campaign database at import time; keep it away from real data
+os.environ['CAMPAIGN_DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='rescheduling-tests-'), 'campaign_state.db')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest  # noqa: E402
+
+from app import normalize_phone_numbers  # noqa: E402
+
+
+@pytest.mark.parametrize('marker', ['x', '#', 'ext', 'ext.', 'EXT:'])
+def test_trailing_extension_marker_keeps_next_row(marker):
+    """A marker with no digits after it must not swallow a digits-only number on the next row"""
+    phones = normalize_phone_numbers([f'5551234567 {marker}', '5551112222', '5553334444'])
+    assert phones == ['+15551234567', '+15551112222', '+15553334444']
+
+
+def test_bare_marker_row_is_unusable_not_merged():
+    assert normalize_phone_numbers(['x', '5551112222']) == ['', '+15551112222']
+
+
+def test_extensions_are_dropped():
+    phones = normalize_phone_numbers(['(555) 123-4567 ext. 12', '555.111.2222 x9', '+44 20 7946 0958 #3'])
+    assert phones == ['+15551234567', '+15551112222', '+442079460958']
+
+
+def test_one_number_per_row():
+    values = ['5551234567', '', 'not a phone', '5551234567.0', 'x', '#', '+1 555 111 2222', None]
+    assert len(normalize_phone_numbers(values)) == len(values)
@@ -0,0 +1,44 @@
+"""Checks that main.RoutedTaskDispatcher routes every request on a connection by its own path"""
+
+import os
+import socket
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from waitress.server import create_server  # noqa: E402
+
+from main import RoutedTaskDispatcher  # noqa: E402
+
+
+def test_pipelined_requests_are_routed_by_their_own_path():
+    routed = []
+
+    def is_long_request(path):
+        routed.append(path)
+        return path == '/long'
+
+    def wsgi_app(environ, start_response):
+        body = environ['PATH_INFO'].encode()
+        start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))])
+        return [body]
+
+    dispatcher = RoutedTaskDispatcher(1, 1, is_long_request)
+    server = create_server(wsgi_app, host='127.0.0.1', port=0, _dispatcher=dispatcher)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        with socket.create_connection(server.socket.getsockname()[:2], timeout=5) as conn:
+            # Both requests in one write: the second is queued only after the first is served
+            conn.sendall(b'GET /short HTTP/1.1\r\nHost: test\r\n\r\n'
+                         b'GET /long HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n')
+            received = b''
+            while chunk := conn.recv(4096):
+                received += chunk
+    finally:
+        server.close()
+        dispatcher.shutdown()
+
+    assert received.count(b'200 OK') == 2
+    assert routed == ['/short', '/long']